@@ -0,0 +1,115 @@
+import time
+from threading import Lock
+from typing import Any, Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+POOL_SIZE = 10
+RETRY_STATUSES = (500, 502, 503, 504)
+
+
+class EndpointStats:
+    """Counters of the calls made to the endpoint."""
+
+    def __init__(self) -> None:
+        self.calls = 0
+        self.failures = 0
+        self.bytes = 0  # received (compressed) bytes
+        self.latency = 0.0  # total latency in seconds
+        self.last_latency = 0.0
+
+    def add(self, latency: float, size: int) -> None:
+        self.calls += 1
+        self.bytes += size
+        self.latency += latency
+        self.last_latency = latency
+
+    def __str__(self) -> str:
+        average = self.latency / self.calls if self.calls else 0.0
+        return (
+            f"calls {self.calls}, failures {self.failures}, "
+            f"avg latency {round(average, 2)}s, last latency {round(self.last_latency, 2)}s, "
+            f"received {round(self.bytes / 1024 ** 2, 2)} MB"
+        )
+
+
+class Endpoint:
+    def __init__(self, timeout: float, retries: int) -> None:
+        self.timeout = timeout
+        self.retries = retries
+        self.stats = EndpointStats()
+
+
+class HttpClient:
+    """Shared HTTP client with keep-alive connection pooling.
+
+    Every endpoint is registered with its URL prefix, timeout and retry
+    budget (retries of one call on connection errors and 5xx responses).
+    Responses are requested gzip compressed.
+    """
+
+    def __init__(self) -> None:
+        self.session = requests.Session()
+        self.session.headers["Accept-Encoding"] = "gzip, deflate"
+        self.endpoints: dict[str, Endpoint] = {}
+        self.lock = Lock()
+
+    def register(
+        self,
+        name: str,
+        url: Optional[str],
+        timeout: float,
+        retries: int,
+        pool_size: int = POOL_SIZE,
+    ) -> None:
+        """Register endpoint, without URL it is used for all other URLs."""
+        adapter = HTTPAdapter(
+            pool_connections=pool_size,
+            pool_maxsize=pool_size,
+            max_retries=Retry(
+                total=retries,
+                backoff_factor=0.5,
+                status_forcelist=RETRY_STATUSES,
+                allowed_methods=["GET"],
+                raise_on_status=False,
+            ),
+        )
+        for prefix in [url] if url else ["https://", "http://"]:
+            self.session.mount(prefix, adapter)
+
+        with self.lock:
+            if name in self.endpoints:
+                self.endpoints[name].timeout = timeout
+                self.endpoints[name].retries = retries
+            else:
+                self.endpoints[name] = Endpoint(timeout, retries)
+
+    def stats(self, name: str) -> EndpointStats:
+        if endpoint := self.endpoints.get(name):
+            return endpoint.stats
+        return EndpointStats()
+
+    def get(self, name: str, url: str, **kwargs: Any) -> requests.Response:
+        """GET request using the timeout of the endpoint."""
+        endpoint = self.endpoints[name]
+        start = time.perf_counter()
+
+        try:
+            response = self.session.get(url, timeout=endpoint.timeout, **kwargs)
+            content = response.content
+        except requests.RequestException:
+            with self.lock:
+                endpoint.stats.failures += 1
+            raise
+
+        size = response.raw.tell() if response.raw else 0
+        with self.lock:
+            endpoint.stats.add(time.perf_counter() - start, size or len(content))
+
+        return response
+
+
+client = HttpClient()
+client.register("download", None, timeout=60, retries=3)
@@ -1,7 +1,21 @@
-from typing import Any, Optional
+import gzip
+import json
+import math
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from itertools import chain
+from pathlib import Path
+from typing import Any, Iterator, Literal, Optional, overload
 
-import requests
+import numpy as np
 from api import load_credentials
+from api.client import client
+
+POLL_INTERVAL = 15  # seconds
+
+# lamin, lomin, lamax, lomax
+BoundingBox = tuple[float, float, float, float]
 
 
 class StateVector:
@@ -44,14 +58,218 @@ class StateVector:
         self.position_source = position_source
 
 
+def _str_column(values: tuple[Any, ...]) -> np.ndarray:
+    """Create string column, missing values are stored as empty strings."""
+    column = np.array(["" if value is None else value for value in values], dtype=str)
+    return np.char.replace(column, ",", "") if len(column) else column
+
+
+def _object_column(values: tuple[Any, ...]) -> np.ndarray:
+    """Create column of python objects (e.g. lists)."""
+    column = np.empty(len(values), dtype=object)
+    column[:] = values
+    return column
+
+
+def _float_column(values: tuple[Any, ...]) -> np.ndarray:
+    """Create float column, missing values are stored as `nan`."""
+    return np.array(values, dtype=np.float64)
+
+
+def _int_column(values: tuple[Any, ...]) -> np.ndarray:
+    """Create integer column, missing values are stored as `0`."""
+    return np.nan_to_num(_float_column(values)).astype(np.int64)
+
+
+def _optional(value: Any) -> Any:
+    """Convert column value back to the python value (or None if missing)."""
+    if isinstance(value, np.generic):
+        value = value.item()
+    if isinstance(value, float) and math.isnan(value):
+        return None
+    if isinstance(value, str) and not value:
+        return None
+    return value
+
+
+class StateVectors:
+    """State vectors stored as columns (struct of arrays).
+
+    Each attribute is a NumPy array with one item per aircraft. Missing float
+    values are stored as `nan`, missing integers as `0` and missing strings as
+    empty strings. Indexing and iterating create `StateVector` objects lazily,
+    so it can be used as a drop-in replacement for `list[StateVector]`.
+    """
+
+    COLUMNS = (
+        "icao24",
+        "callsign",
+        "origin_country",
+        "time_position",
+        "last_contact",
+        "longitude",
+        "latitude",
+        "baro_altitude",
+        "on_ground",
+        "velocity",
+        "true_track",
+        "vertical_rate",
+        "sensors",
+        "geo_altitude",
+        "squawk",
+        "spi",
+        "position_source",
+    )
+
+    def __init__(self, states: list[list[Any]]) -> None:
+        columns = list(zip(*states)) or [() for _ in self.COLUMNS]
+
+        self.icao24 = _str_column(columns[0])
+        self.callsign = _str_column(columns[1])
+        self.origin_country = _str_column(columns[2])
+        self.time_position = _int_column(columns[3])
+        self.last_contact = _int_column(columns[4])
+        self.longitude = _float_column(columns[5])
+        self.latitude = _float_column(columns[6])
+        self.baro_altitude = _float_column(columns[7])
+        self.on_ground = np.array(columns[8], dtype=bool)
+        self.velocity = _float_column(columns[9])
+        self.true_track = _float_column(columns[10])
+        self.vertical_rate = _float_column(columns[11])
+        self.sensors = _object_column(columns[12])
+        self.geo_altitude = _float_column(columns[13])
+        self.squawk = _str_column(columns[14])
+        self.spi = np.array(columns[15], dtype=bool)
+        self.position_source = _int_column(columns[16])
+
+    def filter(self, mask: np.ndarray) -> "StateVectors":
+        """Keep only state vectors selected by the mask (or indices)."""
+        for column in self.COLUMNS:
+            setattr(self, column, getattr(self, column)[mask])
+        return self
+
+    def __len__(self) -> int:
+        return len(self.icao24)
+
+    def __getitem__(self, index: int) -> StateVector:
+        values = {
+            column: _optional(getattr(self, column)[index]) for column in self.COLUMNS
+        }
+        values["time_position"] = values["time_position"] or None
+        return StateVector(**values)
+
+    def __iter__(self) -> Iterator[StateVector]:
+        return (self[i] for i in range(len(self)))
+
+
+def split_globe(rows: int, columns: int) -> list[BoundingBox]:
+    """Split the globe into grid of bounding boxes."""
+    lat_step, lon_step = 180 / rows, 360 / columns
+    return [
+        (
+            -90 + row * lat_step,
+            -180 + column * lon_step,
+            -90 + (row + 1) * lat_step,
+            -180 + (column + 1) * lon_step,
+        )
+        for row in range(rows)
+        for column in range(columns)
+    ]
+
+
+def regions_from_env() -> Optional[list[BoundingBox]]:
+    """Get regions from the `OPENSKY_REGIONS` variable in format `<rows>x<columns>`."""
+    if value := os.environ.get("OPENSKY_REGIONS"):
+        rows, columns = (int(i) for i in value.lower().split("x"))
+        return split_globe(rows, columns)
+    return None
+
+
+@overload
+def decode_states(
+    states: Optional[list[list[Any]]], columnar: Literal[False] = False
+) -> Optional[list[StateVector]]:
+    ...
+
+
+@overload
+def decode_states(
+    states: Optional[list[list[Any]]], columnar: Literal[True]
+) -> Optional[StateVectors]:
+    ...
+
+
+@overload
+def decode_states(
+    states: Optional[list[list[Any]]], columnar: bool
+) -> Optional[list[StateVector] | StateVectors]:
+    ...
+
+
+def decode_states(
+    states: Optional[list[list[Any]]], columnar: bool = False
+) -> Optional[list[StateVector] | StateVectors]:
+    """Decode states of the `/states/all` response, skip aircrafts without position."""
+    try:
+        if states is not None and columnar:
+            columns = StateVectors(states)
+            latitude = columns.latitude
+            return columns.filter(~np.isnan(latitude) & (latitude != 0))
+
+        if states is not None:
+            state_vectors: list[StateVector] = []
+            for state_vector in states:
+                state_vector = [
+                    attr.replace(",", "") if isinstance(attr, str) else attr
+                    for attr in state_vector
+                ]
+                state_vectors.append(StateVector(*state_vector))
+
+            return [
+                state_vector for state_vector in state_vectors if state_vector.latitude
+            ]
+    except TypeError:
+        return None
+
+    return None
+
+
 class OpenSkyApi:
     date_format = "%d/%m/%Y-%H:%M"
+    poll_interval = POLL_INTERVAL
 
     def __init__(
-        self, username: Optional[str] = None, password: Optional[str] = None
+        self,
+        username: Optional[str] = None,
+        password: Optional[str] = None,
+        regions: Optional[list[BoundingBox]] = None,
+        record_path: Optional[str | Path] = None,
     ) -> None:
         self.api_url = "https://opensky-network.org/api"
 
+        # directory for recording of the responses
+        record_path = record_path or os.environ.get("OPENSKY_RECORD")
+        self.record_path = Path(record_path) if record_path else None
+        if self.record_path:
+            self.record_path.mkdir(parents=True, exist_ok=True)
+
+        # regions are fetched concurrently over pooled connections
+        self.regions = regions or regions_from_env()
+        client.register(
+            "opensky",
+            self.api_url,
+            timeout=20,
+            retries=1,
+            pool_size=max(len(self.regions or []), 1),
+        )
+        self.executor = (
+            ThreadPoolExecutor(
+                max_workers=len(self.regions), thread_name_prefix="OpenSky"
+            )
+            if self.regions
+            else None
+        )
+
         if not username or not password:
             credentials = load_credentials("opensky", values=["username", "password"])
             if not credentials:
@@ -60,40 +278,99 @@ class OpenSkyApi:
             username, password = credentials
 
         self._auth = (username, password)
+        # seconds to wait after the rate limit was reached
+        self.retry_after: Optional[int] = None
+
+    def now(self) -> int:
+        """Current time of the data."""
+        return int(time.time())
+
+    def record(self, states: list[list[Any]]) -> None:
+        """Save states into compressed file named by the current time."""
+        now = self.now()
+        with gzip.open(self.record_path / f"states-{now}.json.gz", "wt") as file:  # type: ignore[operator]
+            json.dump({"time": now, "states": states}, file)
 
     def __api_call(self, api_path: str, params: Optional[dict[str, Any]] = None):
         try:
-            response = requests.get(
-                f"{self.api_url}/{api_path}", auth=self._auth, params=params, timeout=20
+            response = client.get(
+                "opensky", f"{self.api_url}/{api_path}", auth=self._auth, params=params
             )
         except Exception:
             return None
 
+        if response.status_code == 429:
+            self.retry_after = int(
+                response.headers.get("X-Rate-Limit-Retry-After-Seconds", 0)
+            )
+
         if response.status_code == 200:
             return response.json()
         return None
 
+    def __get_states(
+        self, params: Optional[dict[str, Any]] = None
+    ) -> Optional[list[list[Any]]]:
+        response = self.__api_call("/states/all", params=params)
+        if response is None:
+            return None
+        # no aircraft (e.g. in a region) is sent as null states
+        return response.get("states") or []
+
+    def __get_regions_states(self) -> Optional[list[list[Any]]]:
+        """Get states from all regions, aircrafts on the edges are merged."""
+        keys = ("lamin", "lomin", "lamax", "lomax")
+        results = list(
+            self.executor.map(  # type: ignore[union-attr]
+                lambda region: self.__get_states(dict(zip(keys, region))),
+                self.regions,  # type: ignore[arg-type]
+            )
+        )
+
+        # skip only regions that failed
+        if all(result is None for result in results):
+            return None
+
+        # keep the newest state of every aircraft (by last contact)
+        states: dict[str, list[Any]] = {}
+        for state in chain.from_iterable(result for result in results if result):
+            if (prev := states.get(state[0])) is None or prev[4] < state[4]:
+                states[state[0]] = state
+
+        return list(states.values())
+
+    @overload
     def get_all_state_vectors(
-        self, icao24: Optional[list[str]] = None
+        self, icao24: Optional[list[str]] = None, columnar: Literal[False] = False
     ) -> Optional[list[StateVector]]:
+        ...
+
+    @overload
+    def get_all_state_vectors(
+        self, icao24: Optional[list[str]] = None, *, columnar: Literal[True]
+    ) -> Optional[StateVectors]:
+        ...
+
+    def get_all_state_vectors(
+        self, icao24: Optional[list[str]] = None, columnar: bool = False
+    ) -> Optional[list[StateVector] | StateVectors]:
+        """Get state vectors of all aircrafts with known position.
+
+        Args:
+            icao24 (Optional[list[str]]): filter aircrafts by icao24
+            columnar (bool): decode response into `StateVectors` columns
+
+        Returns:
+            Optional[list[StateVector] | StateVectors]: state vectors or None in case of error
+        """
+        self.retry_after = None
         params = {"icao24": value for value in icao24} if icao24 is not None else None
-        response = self.__api_call("/states/all", params=params)
-        try:
-            if response is not None:
-                state_vectors: list[StateVector] = []
-                for state_vector in response["states"]:
-                    state_vector = [
-                        attr.replace(",", "") if isinstance(attr, str) else attr
-                        for attr in state_vector
-                    ]
-                    state_vectors.append(StateVector(*state_vector))
-
-                return [
-                    state_vector
-                    for state_vector in state_vectors
-                    if state_vector.latitude
-                ]
-        except TypeError:
-            return None
+        if params is None and self.executor is not None:
+            states = self.__get_regions_states()
+        else:
+            states = self.__get_states(params)
 
-        return None
+        if states is not None and params is None and self.record_path:
+            self.record(states)
+
+        return decode_states(states, columnar)
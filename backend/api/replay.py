@@ -0,0 +1,112 @@
+import gzip
+import json
+import os
+import time
+from pathlib import Path
+from typing import Any, Literal, Optional, overload
+
+from api.opensky import POLL_INTERVAL, StateVector, StateVectors, decode_states
+
+SYNTHETIC_OFFSET = 0.5  # degrees between synthesized copies of the aircraft
+
+
+def synthesize_states(states: list[list[Any]], scale: int) -> list[list[Any]]:
+    """Add `scale - 1` shifted copies of every aircraft.
+
+    Copies keep their offset for the whole replay, so their tracks stay valid.
+    """
+    output = list(states)
+    for copy in range(1, scale):
+        offset = copy * SYNTHETIC_OFFSET
+        for state in states:
+            state = list(state)
+            state[0] = f"{state[0]}-{copy}"
+            if state[5] is not None:
+                state[5] = (state[5] + offset + 180) % 360 - 180
+            if state[6] is not None:
+                state[6] = max(-90.0, min(90.0, state[6] + offset))
+            output.append(state)
+    return output
+
+
+class OpenSkyReplayApi:
+    """Replays responses recorded by `OpenSkyApi` instead of the live API.
+
+    Times in the responses are moved, so the first response is replayed as the
+    current time. The thread polls the replay with the recorded interval
+    divided by `speed` and `now` follows the replayed data, so the replay
+    behaves the same at any speed. With `loop` the recording starts again and
+    times keep increasing.
+    """
+
+    def __init__(
+        self, path: str | Path, speed: float = 1.0, scale: int = 1, loop: bool = True
+    ) -> None:
+        self.files = sorted(Path(path).glob("states-*.json.gz"))
+        if not self.files:
+            raise Exception(f"No recorded responses in {path}!")
+
+        self.times = [int(file.name.split(".")[0].split("-")[1]) for file in self.files]
+        intervals = [end - start for start, end in zip(self.times, self.times[1:])]
+        self.interval = sorted(intervals)[len(intervals) // 2] if intervals else 15
+        self.poll_interval = (self.interval or POLL_INTERVAL) / speed
+
+        self.scale = scale
+        self.loop = loop
+        self.index = 0
+        self.offset = int(time.time()) - self.times[0]
+        self.current = int(time.time())
+        self.retry_after: Optional[int] = None
+
+    def now(self) -> int:
+        """Current time of the replayed data."""
+        return self.current
+
+    def next_states(self) -> Optional[list[list[Any]]]:
+        if self.index >= len(self.files):
+            if not self.loop:
+                return None
+            # continue after the end of the recording
+            self.offset += self.times[-1] - self.times[0] + self.interval
+            self.index = 0
+
+        with gzip.open(self.files[self.index], "rt") as file:
+            states = json.load(file)["states"] or []
+
+        self.current = self.times[self.index] + self.offset
+        self.index += 1
+
+        for state in states:
+            for i in (3, 4):  # time_position, last_contact
+                if state[i] is not None:
+                    state[i] += self.offset
+
+        return synthesize_states(states, self.scale)
+
+    @overload
+    def get_all_state_vectors(
+        self, icao24: Optional[list[str]] = None, columnar: Literal[False] = False
+    ) -> Optional[list[StateVector]]:
+        ...
+
+    @overload
+    def get_all_state_vectors(
+        self, icao24: Optional[list[str]] = None, *, columnar: Literal[True]
+    ) -> Optional[StateVectors]:
+        ...
+
+    def get_all_state_vectors(
+        self, icao24: Optional[list[str]] = None, columnar: bool = False
+    ) -> Optional[list[StateVector] | StateVectors]:
+        return decode_states(self.next_states(), columnar)
+
+
+def replay_from_env() -> Optional[OpenSkyReplayApi]:
+    """Get replay when `OPENSKY_REPLAY` is set (directory with the recording)."""
+    if path := os.environ.get("OPENSKY_REPLAY"):
+        return OpenSkyReplayApi(
+            path,
+            speed=float(os.environ.get("OPENSKY_REPLAY_SPEED") or 1),
+            scale=int(os.environ.get("OPENSKY_REPLAY_SCALE") or 1),
+        )
+    return None
@@ -1,8 +1,8 @@
 from datetime import datetime, timezone
 from typing import Callable
 
-import requests
 from api import load_credentials
+from api.client import client
 
 
 class SpokenDataApi:
@@ -10,6 +10,7 @@ class SpokenDataApi:
 
     def __init__(self) -> None:
         self.api_url = "https://engine.spokendata.com/api/v2"
+        client.register("spokendata", self.api_url, timeout=15.00, retries=2)
 
         if key := load_credentials("spokendata", values=["API-key"]):
             self._api_key = key[0]
@@ -30,11 +31,11 @@ class SpokenDataApi:
         return decorator
 
     def __api_call(self, api_path: str, params: dict[str, str] = {}):
-        response = requests.get(
+        response = client.get(
+            "spokendata",
             f"{self.api_url}/{api_path}",
             params=params,
             headers={"X-API-Key": self._api_key},
-            timeout=15.00,
         )
         if response.status_code == 200:
             return response.json()
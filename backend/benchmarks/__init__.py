@@ -0,0 +1,19 @@
+import time
+from typing import Callable
+
+
+def measure(func: Callable[[], object], repeat: int) -> float:
+    """Best time of `repeat` calls in seconds."""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def report(name: str, before: float, after: float) -> None:
+    print(
+        f"{name:<24} {before * 1000:>9.2f} ms {after * 1000:>9.2f} ms"
+        f" {before / after if after else float('inf'):>7.1f}x"
+    )
@@ -0,0 +1,203 @@
+"""Clustering of all zoom levels by DBSCAN (per zoom) vs the hierarchical grid
+(and the grid with stable ids between ticks) and the post-processing of the
+DBSCAN labels by Python loops vs arrays.
+
+DBSCAN runs in the calling process, one zoom after another (the same work
+the pool of processes shares). Positions are seeded, so the runs are
+reproducible. The benchmark fails when the grid does not produce a number
+of clusters comparable to DBSCAN (within `PARITY` times), zooms where
+DBSCAN chained most of the aircraft into one cluster are not compared.
+
+Run from the backend directory: python -m benchmarks.clustering [--sizes N ...]
+"""
+import argparse
+import sys
+from typing import Any
+
+import numpy as np
+from benchmarks import measure, report
+from clustering import ZOOM_LEVELS, Cluster, to_clusters
+from clustering.dbscan import assign_noise, cluster_labels, dbscan_labels
+from clustering.grid import grid_labels
+from clustering.stable import StableGrid
+from sklearn.neighbors import BallTree
+
+HUBS = 200
+PARITY = 2.0  # allowed ratio of the numbers of clusters
+CHAINED = 0.5  # share of the aircraft in the largest cluster of DBSCAN
+TICK_DISTANCE = 0.03  # degrees, an aircraft flies about 3.5 km between ticks
+
+
+def synthetic_positions(count: int, seed: int = 0) -> np.ndarray:
+    """Positions (in degrees), half around busy hubs and half all over the globe."""
+    generator = np.random.default_rng(seed)
+    hubs = np.column_stack(
+        (generator.uniform(-50, 65, HUBS), generator.uniform(-180, 180, HUBS))
+    )
+    around = hubs[generator.integers(HUBS, size=count // 2)] + generator.normal(
+        0, 1.5, (count // 2, 2)
+    )
+    spread = np.column_stack(
+        (
+            np.degrees(np.arcsin(generator.uniform(-1, 1, count - count // 2))),
+            generator.uniform(-180, 180, count - count // 2),
+        )
+    )
+    positions = np.concatenate((around, spread))
+    positions[:, 0] = np.clip(positions[:, 0], -89.9, 89.9)
+    positions[:, 1] = (positions[:, 1] + 180) % 360 - 180
+    return positions
+
+
+def dbscan_zoom_labels(positions: np.ndarray) -> list[np.ndarray]:
+    points_rad = np.radians(positions)
+    return [cluster_labels(points_rad, zoom) for zoom in ZOOM_LEVELS]
+
+
+def loop_post_processing(
+    data: list[dict[str, Any]], points_rad: np.ndarray, labels: np.ndarray
+) -> list[Cluster]:
+    """Previous post-processing: query per noise point and `np.where` per label."""
+    label_clusters = np.where(labels != -1)[0]
+    if len(label_clusters):
+        tree = BallTree(points_rad[label_clusters])
+
+        for noise in np.where(labels == -1)[0]:
+            _, indices = tree.query([points_rad[noise]], k=2)
+            labels[noise] = labels[label_clusters[indices[0][1]]]
+
+    clusters: list[Cluster] = []
+    for label in set(labels):
+        indices = np.where(labels == label)[0]
+        lat = np.mean([data[j]["position"][0] for j in indices])
+        long = np.mean([data[j]["position"][1] for j in indices])
+        clusters.append(
+            Cluster(
+                cluster=int(label),
+                position=(lat, long),
+                data=[{**data[j]} for j in indices],
+            )
+        )
+    return clusters
+
+
+def array_post_processing(
+    data: list[dict[str, Any]],
+    positions: np.ndarray,
+    points_rad: np.ndarray,
+    labels: np.ndarray,
+) -> list[Cluster]:
+    return to_clusters(data, positions, assign_noise(points_rad, labels))
+
+
+def moved(positions: np.ndarray, seed: int = 0) -> np.ndarray:
+    """Positions after one tick, every aircraft flies in a random direction."""
+    heading = np.random.default_rng(seed).uniform(0, 2 * np.pi, len(positions))
+    return positions + TICK_DISTANCE * np.column_stack(
+        (np.cos(heading), np.sin(heading))
+    )
+
+
+def clusters(labels: list[np.ndarray]) -> list[int]:
+    return [len(np.unique(zoom_labels)) for zoom_labels in labels]
+
+
+def chained(labels: list[np.ndarray]) -> list[bool]:
+    """Zooms where DBSCAN put most of the aircraft into one cluster."""
+    return [
+        np.unique(zoom_labels, return_counts=True)[1].max() > CHAINED * len(zoom_labels)
+        for zoom_labels in labels
+    ]
+
+
+def parity(dbscan: list[np.ndarray], grid: list[np.ndarray], name: str) -> bool:
+    """Print numbers of clusters of each zoom, True if they are comparable."""
+    ratios = [
+        None if skip else count / expected
+        for count, expected, skip in zip(
+            clusters(grid), clusters(dbscan), chained(dbscan)
+        )
+    ]
+    ok = all(ratio is None or 1 / PARITY <= ratio <= PARITY for ratio in ratios)
+    print(f"    clusters per zoom dbscan: {' '.join(map(str, clusters(dbscan)))}")
+    print(f"    clusters per zoom {name + ':':<7} {' '.join(map(str, clusters(grid)))}")
+    print(
+        f"    {name + ' / dbscan:':<26}"
+        f"{' '.join('-' if ratio is None else f'{ratio:.2f}' for ratio in ratios)}"
+        f" ({'OK' if ok else 'FAILED'}, - chained by DBSCAN)"
+    )
+    return ok
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[5000, 20000, 100000])
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--zoom", type=int, default=max(ZOOM_LEVELS))
+    args = parser.parse_args()
+
+    comparable = True
+    print(f"{'aircraft':<24} {'dbscan':>12} {'grid':>12}")
+    for size in args.sizes:
+        positions = synthetic_positions(size)
+        before = measure(lambda: dbscan_zoom_labels(positions), args.repeat)
+        after = measure(lambda: grid_labels(positions, ZOOM_LEVELS), args.repeat)
+        report(str(size), before, after)
+        comparable &= parity(
+            dbscan_zoom_labels(positions), grid_labels(positions, ZOOM_LEVELS), "grid"
+        )
+
+    # one tick of the stable grid after the previous one (ids are kept)
+    print(f"\n{'one tick of aircraft':<24} {'grid':>12} {'stable':>12}")
+    for size in args.sizes:
+        positions = synthetic_positions(size)
+        keys = np.array([f"{i:06x}" for i in range(size)])
+        stable = StableGrid()
+        before_tick = stable.labels(keys, positions, ZOOM_LEVELS)
+        state = vars(stable).copy()
+        next_positions = moved(positions)
+
+        def tick() -> list[np.ndarray]:
+            # every measured tick follows the same previous tick
+            vars(stable).update(state)
+            return stable.labels(keys, next_positions, ZOOM_LEVELS)
+
+        report(
+            str(size),
+            measure(lambda: grid_labels(next_positions, ZOOM_LEVELS), args.repeat),
+            measure(tick, args.repeat),
+        )
+        after_tick = tick()
+        comparable &= parity(dbscan_zoom_labels(next_positions), after_tick, "stable")
+        kept = [
+            f"{np.mean(previous == current):.2f}"
+            for previous, current in zip(before_tick, after_tick)
+        ]
+        print(f"    ids kept after the tick:  {' '.join(kept)}")
+
+    print(f"\npost-processing of zoom {args.zoom} {'loops':>10} {'arrays':>12}")
+    for size in args.sizes:
+        positions = synthetic_positions(size)
+        points_rad = np.radians(positions)
+        data = [
+            {"id": i, "position": tuple(p)} for i, p in enumerate(positions.tolist())
+        ]
+        labels = dbscan_labels(points_rad, args.zoom)
+        loops = loop_post_processing(data, points_rad, labels.copy())
+        arrays = array_post_processing(data, positions, points_rad, labels.copy())
+        assert sorted(len(c.data) for c in loops) == sorted(len(c.data) for c in arrays)
+
+        before = measure(
+            lambda: loop_post_processing(data, points_rad, labels.copy()), args.repeat
+        )
+        after = measure(
+            lambda: array_post_processing(data, positions, points_rad, labels.copy()),
+            args.repeat,
+        )
+        report(f"{size} ({len(arrays)} clusters)", before, after)
+
+    return 0 if comparable else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,155 @@
+"""Per-tick cost of the flight records stored as datetimes vs unix timestamps.
+
+Run from the backend directory: python -m benchmarks.records [--flights N]
+"""
+import argparse
+import random
+import time
+from datetime import datetime
+
+from benchmarks import measure, report
+from flask_app.api.api import to_date
+from sqlalchemy import (
+    Column,
+    DateTime,
+    Integer,
+    MetaData,
+    Table,
+    bindparam,
+    create_engine,
+    insert,
+    select,
+    update,
+)
+
+metadata = MetaData()
+
+dates = Table(
+    "flight_dates",
+    metadata,
+    Column("id", Integer, primary_key=True),
+    Column("first_record", DateTime, nullable=False),
+    Column("last_record", DateTime, nullable=False),
+)
+
+epochs = Table(
+    "flight_epochs",
+    metadata,
+    Column("id", Integer, primary_key=True),
+    Column("first_record", Integer, nullable=False, index=True),
+    Column("last_record", Integer, nullable=False, index=True),
+)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--flights", type=int, default=10_000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    engine = create_engine("sqlite://")
+    metadata.create_all(engine)
+
+    now = int(time.time())
+    # flights of the retention period (two days), each up to 6 hours long
+    records = [
+        (last - random.randint(600, 6 * 3600), last)
+        for last in (
+            now - random.randint(0, 2 * 24 * 3600) for _ in range(args.flights)
+        )
+    ]
+    start, end = now - 300, now
+
+    with engine.begin() as connection:
+        connection.execute(
+            insert(dates),
+            [
+                {
+                    "id": id,
+                    "first_record": datetime.fromtimestamp(first),
+                    "last_record": datetime.fromtimestamp(last),
+                }
+                for id, (first, last) in enumerate(records, 1)
+            ],
+        )
+        connection.execute(
+            insert(epochs),
+            [
+                {"id": id, "first_record": first, "last_record": last}
+                for id, (first, last) in enumerate(records, 1)
+            ],
+        )
+
+    def tick_mappings(convert) -> None:
+        # values of the changed flights (FlightProps.to_mapping)
+        [{"last_record": convert(last + 15)} for _, last in records]
+
+    def tick_update(table: Table, convert) -> None:
+        # bulk update of the last record of every flight (one OpenSky tick)
+        with engine.begin() as connection:
+            connection.execute(
+                update(table)
+                .where(table.c.id == bindparam("b_id"))
+                .values(last_record=bindparam("last_record")),
+                [
+                    {"b_id": id, "last_record": convert(last + 15)}
+                    for id, (_, last) in enumerate(records, 1)
+                ],
+            )
+
+    def api_flights(table: Table, convert) -> None:
+        # /api/flights formats both records of every flight
+        with engine.connect() as connection:
+            for first, last in connection.execute(
+                select(table.c.first_record, table.c.last_record)
+            ):
+                to_date(convert(first))
+                to_date(convert(last))
+
+    def interval(table: Table, convert, bounded: bool = True) -> None:
+        # flights matched to the recording (Flight.within_interval)
+        d_start, d_end = convert(start), convert(end)
+        first, last = table.c.first_record, table.c.last_record
+        condition = ((first <= d_end) & (d_end <= last)) | (
+            (first <= d_start) & (d_start <= last)
+        )
+        if bounded:
+            # range of the last record (index)
+            condition = (d_start <= last) & condition
+        with engine.connect() as connection:
+            connection.execute(select(table.c.id).where(condition)).all()
+
+    to_timestamp = lambda date: int(datetime.timestamp(date))
+    identity = lambda value: value
+
+    print(f"{args.flights} flights, best of {args.repeat}")
+    print(f"{'':<24} {'datetime':>12} {'epoch':>12} {'speedup':>8}")
+    report(
+        "tick mappings",
+        measure(lambda: tick_mappings(datetime.fromtimestamp), args.repeat),
+        measure(lambda: tick_mappings(identity), args.repeat),
+    )
+    report(
+        "tick update",
+        measure(lambda: tick_update(dates, datetime.fromtimestamp), args.repeat),
+        measure(lambda: tick_update(epochs, identity), args.repeat),
+    )
+    report(
+        "api flights",
+        measure(lambda: api_flights(dates, to_timestamp), args.repeat),
+        measure(lambda: api_flights(epochs, identity), args.repeat),
+    )
+    report(
+        "within interval",
+        measure(lambda: interval(dates, datetime.fromtimestamp), args.repeat),
+        measure(lambda: interval(epochs, identity), args.repeat),
+    )
+    report(
+        "within interval (unbound)",
+        measure(lambda: interval(dates, datetime.fromtimestamp, False), args.repeat),
+        measure(lambda: interval(epochs, identity, False), args.repeat),
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+"""Storage of the flight tracks as timestamp rows vs compacted tracks.
+
+Run from the backend directory: python -m benchmarks.tracks [--flights N]
+"""
+import argparse
+import os
+import random
+import tempfile
+import time
+
+from benchmarks import measure
+from database.models import Timestamp, Track
+from database.track import TrackPoint, decode_track, encode_track, simplify
+from sqlalchemy import create_engine, insert
+
+
+def synthetic_track(points: int) -> list[TrackPoint]:
+    """Track of the aircraft flying straight with small changes."""
+    timestamp = int(time.time()) - points * 15
+    latitude, longitude = random.uniform(-60, 60), random.uniform(-180, 180)
+    altitude = random.uniform(3000, 11000)
+    track = []
+    for _ in range(points):
+        timestamp += random.choice((10, 15, 20))
+        latitude += random.gauss(0.02, 0.002)
+        longitude += random.gauss(0.03, 0.002)
+        altitude += random.choice((0, 0, 0, 7.62, -7.62))
+        track.append(TrackPoint(timestamp, latitude, longitude, altitude))
+    return track
+
+
+def database_size(table, rows: list[dict]) -> int:
+    """Size of the SQLite database with the rows (and indexes of the table)."""
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "size.db")
+        engine = create_engine(f"sqlite:///{path}")
+        table.create(engine)
+        with engine.begin() as connection:
+            connection.execute(insert(table), rows)
+        engine.dispose()
+        return os.path.getsize(path)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--flights", type=int, default=200)
+    parser.add_argument("--points", type=int, default=1000)
+    parser.add_argument("--tolerance", type=float, default=25.0)
+    args = parser.parse_args()
+
+    tracks = [synthetic_track(args.points) for _ in range(args.flights)]
+    timestamps = [
+        {
+            "flight_id": flight_id,
+            "timestamp": point.timestamp,
+            "latitude": point.latitude,
+            "longitude": point.longitude,
+            "altitude": point.altitude,
+        }
+        for flight_id, track in enumerate(tracks, 1)
+        for point in track
+    ]
+
+    rows_size = database_size(Timestamp.__table__, timestamps)
+    print(f"{args.flights} flights with {args.points} points")
+    print(f"{'timestamp rows':<28} {rows_size / 1024:>10.0f} kB")
+
+    for name, tolerance in (
+        ("tracks", 0.0),
+        (f"tracks ({args.tolerance} m)", args.tolerance),
+    ):
+        encoded = [encode_track(simplify(track, tolerance)) for track in tracks]
+        size = database_size(
+            Track.__table__,
+            [{"flight_id": id, "data": data} for id, data in enumerate(encoded, 1)],
+        )
+        print(f"{name:<28} {size / 1024:>10.0f} kB {rows_size / size:>7.1f}x")
+
+    decode = measure(lambda: [decode_track(data) for data in encoded], 5)
+    print(f"{'decode one track':<28} {decode / args.flights * 1000:>10.3f} ms")
+
+
+if __name__ == "__main__":
+    main()
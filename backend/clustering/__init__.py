@@ -1,13 +1,21 @@
-from multiprocessing import Pool, cpu_count
-from typing import Any, Optional
+import atexit
+import os
+from typing import Any, Callable, Optional
 
 import numpy as np
 from profiling_decorators import time_profile
-from sklearn.cluster import DBSCAN
-from sklearn.neighbors import BallTree
+
+from .dbscan import cluster_labels
+from .executor import ClusteringExecutor, default_processes
+from .grid import grid_labels
+from .stable import StableGrid
+from .tiles import TileIndex
 
 ZOOM_LEVELS = [i for i in range(1, 8)]
 
+# (keys, positions, zooms) -> labels for each zoom
+Engine = Callable[[np.ndarray, np.ndarray, list[int]], list[np.ndarray]]
+
 
 class Cluster:
     def __init__(
@@ -21,67 +29,107 @@ class Cluster:
         return {"cluster": self.cluster, "position": self.position, "data": self.data}
 
 
-# TODO: in future change whole implementation
-# since in the FE of the application planes are jumping all over the place
-def get_cluster(data: list[dict[str, Any]], zoom: int) -> list[Cluster]:
-    if not data:
+# processes are started with the first clustering and kept until exit
+executor = ClusteringExecutor(default_processes(ZOOM_LEVELS))
+atexit.register(executor.close)
+
+# labels of the aircraft (keys) with positions (in degrees) for each zoom:
+# "dbscan" clusters every zoom independently in the pool of processes,
+# "grid" builds all zooms in one pass (nested clusters),
+# "stable" keeps clusters of the aircraft and their ids between ticks
+ENGINES: dict[str, Engine] = {
+    "dbscan": lambda keys, positions, zooms: executor.labels(positions, zooms),
+    "grid": lambda keys, positions, zooms: grid_labels(positions, zooms),
+    "stable": StableGrid().labels,
+}
+CLUSTERING_ENGINE = os.environ.get("CLUSTERING_ENGINE") or "dbscan"
+
+
+def centroids(positions: np.ndarray, inverse: np.ndarray, count: int) -> np.ndarray:
+    """Mean positions (in degrees) of the groups, averaged as unit vectors,
+    so groups over the antimeridian are centered correctly."""
+    latitude, longitude = np.radians(positions).T
+    x, y, z = (
+        np.bincount(inverse, vector, count)
+        for vector in (
+            np.cos(latitude) * np.cos(longitude),
+            np.cos(latitude) * np.sin(longitude),
+            np.sin(latitude),
+        )
+    )
+    return np.degrees(
+        np.column_stack((np.arctan2(z, np.hypot(x, y)), np.arctan2(y, x)))
+    )
+
+
+def to_clusters(
+    data: list[dict[str, Any]], positions: np.ndarray, labels: np.ndarray
+) -> list[Cluster]:
+    """Group flights by their cluster labels."""
+    if not len(labels):
         return []
 
-    # positions to np.array
-    X = np.array([i["position"] for i in data])
-    # to use radians
-    points_rad = np.radians(X)
-
-    # eps was evaluated based on the graph using geogebra
-    # so that there will be no big differences between zooms
-    eps_0 = 0.1
-    eps = eps_0 * 2 ** (-0.7 * zoom)
-    clustering = DBSCAN(
-        eps=eps, min_samples=2, algorithm="ball_tree", metric="haversine"
-    ).fit(points_rad)
-
-    # get lables (clusters)
-    labels = clustering.labels_
-
-    # find lables that are considered as noise
-    label_clusters = np.where(labels != -1)[0]
-    # assign noise to the closes cluster
-    if len(label_clusters):
-        tree = BallTree(points_rad[label_clusters])
-
-        for noise in np.where(labels == -1)[0]:
-            _, indices = tree.query([points_rad[noise]], k=2)
-            nearest_cluster = labels[label_clusters[indices[0][1]]]
-            labels[noise] = nearest_cluster
-
-    clusters: list[Cluster] = []
-
-    for label in set(labels):
-        # find all coordinates that belong to this cluster
-        indices = np.where(labels == label)[0]
-        # calculate mean from lats and longs
-        lat = np.mean([data[j]["position"][0] for j in indices])
-        long = np.mean([data[j]["position"][1] for j in indices])
-        clusters.append(
-            Cluster(
-                cluster=int(label),
-                position=(lat, long),
-                data=[{**data[j]} for j in indices],
-            )
+    clusters, inverse = np.unique(labels, return_inverse=True)
+    inverse = inverse.reshape(-1)
+    # members of each cluster are one slice of the flights ordered by cluster
+    order = np.argsort(inverse, kind="stable")
+    ends = np.cumsum(np.bincount(inverse, minlength=len(clusters)))
+
+    return [
+        Cluster(
+            cluster=label,
+            position=(lat, long),
+            data=[data[j] for j in order[start:end].tolist()],
         )
+        for label, (lat, long), start, end in zip(
+            clusters.tolist(),
+            centroids(positions, inverse, len(clusters)).tolist(),
+            [0] + ends[:-1].tolist(),
+            ends.tolist(),
+        )
+    ]
+
 
-    return clusters
+def positions_of(data: list[dict[str, Any]]) -> np.ndarray:
+    return np.array([i["position"] for i in data], dtype=np.float64).reshape(-1, 2)
+
+
+# NOTE: labels of DBSCAN are arbitrary in every tick, so planes are jumping
+# between the clusters in the FE, the "stable" engine keeps them
+def get_cluster(data: list[dict[str, Any]], zoom: int) -> list[Cluster]:
+    """Get clusters for the zoom (in the calling process)."""
+    if not data:
+        return []
+
+    positions = positions_of(data)
+    return to_clusters(data, positions, cluster_labels(np.radians(positions), zoom))
 
 
 @time_profile
 def get_clusters(data: list[dict[str, Any]]) -> dict[int, list[Cluster]]:
     """Get cluster for each zoom."""
-
-    # number of processes to be used
-    p_count = x if (x := max(ZOOM_LEVELS)) < (y := cpu_count()) else y
-
-    with Pool(processes=p_count) as p:
-        result = p.starmap(get_cluster, [(data, zoom) for zoom in ZOOM_LEVELS])
-        return {ZOOM_LEVELS[i]: value for i, value in enumerate(result)} | {
-            -1: [Cluster(cluster=-1, position=None, data=data)]
-        }
+    output: dict[int, list[Cluster]] = {zoom: [] for zoom in ZOOM_LEVELS}
+
+    if data:
+        positions = positions_of(data)
+        keys = np.array([i["icao24"] for i in data])
+        labels_of_zooms = ENGINES[CLUSTERING_ENGINE](keys, positions, ZOOM_LEVELS)
+        for zoom, labels in zip(ZOOM_LEVELS, labels_of_zooms):
+            output[zoom] = to_clusters(data, positions, labels)
+
+    return output | {-1: [Cluster(cluster=-1, position=None, data=data)]}
+
+
+def tile_indexes(clusters: dict[int, list[Cluster]]) -> dict[int, TileIndex[Any]]:
+    """Index clusters of each zoom by the map tiles of the zoom, all flights
+    (zoom -1) by the tiles of the next zoom."""
+    indexes: dict[int, TileIndex[Any]] = {
+        zoom: TileIndex(
+            clusters[zoom],
+            np.array([cluster.position for cluster in clusters[zoom]]),
+            zoom,
+        )
+        for zoom in ZOOM_LEVELS
+    }
+    data = clusters[-1][0].data if clusters[-1] else []
+    return indexes | {-1: TileIndex(data, positions_of(data), max(ZOOM_LEVELS) + 1)}
@@ -0,0 +1,35 @@
+import numpy as np
+from sklearn.cluster import DBSCAN
+from sklearn.neighbors import BallTree
+
+
+def dbscan_labels(points_rad: np.ndarray, zoom: int) -> np.ndarray:
+    """Get DBSCAN labels (-1 is noise) of the positions (in radians)."""
+    # eps was evaluated based on the graph using geogebra
+    # so that there will be no big differences between zooms
+    eps_0 = 0.1
+    eps = eps_0 * 2 ** (-0.7 * zoom)
+    clustering = DBSCAN(
+        eps=eps, min_samples=2, algorithm="ball_tree", metric="haversine"
+    ).fit(points_rad)
+
+    return clustering.labels_
+
+
+def assign_noise(points_rad: np.ndarray, labels: np.ndarray) -> np.ndarray:
+    """Assign noise to the close cluster (all noise points in one query)."""
+    noise = np.flatnonzero(labels == -1)
+    label_clusters = np.flatnonzero(labels != -1)
+    if not len(noise) or not len(label_clusters):
+        return labels
+
+    tree = BallTree(points_rad[label_clusters])
+    # second nearest clustered point (clusters have at least 2 points)
+    _, indices = tree.query(points_rad[noise], k=2)
+    labels[noise] = labels[label_clusters[indices[:, 1]]]
+    return labels
+
+
+def cluster_labels(points_rad: np.ndarray, zoom: int) -> np.ndarray:
+    """Get cluster label of each position (in radians) for the zoom."""
+    return assign_noise(points_rad, dbscan_labels(points_rad, zoom))
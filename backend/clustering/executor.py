@@ -0,0 +1,80 @@
+"""Long-lived pool of the clustering processes.
+
+Positions of the flights are published once per tick in a shared memory
+buffer, workers cluster them for one zoom and return only the labels, so
+neither the flights nor the clusters are pickled between the processes.
+"""
+from multiprocessing import Pool, cpu_count
+from multiprocessing.pool import Pool as ProcessPool
+from multiprocessing.shared_memory import SharedMemory
+from typing import Optional
+
+import numpy as np
+
+from .dbscan import cluster_labels
+
+INITIAL_CAPACITY = 16_384  # positions
+
+
+def shared_labels(name: str, count: int, zoom: int) -> np.ndarray:
+    """Cluster the first `count` positions of the shared buffer (worker)."""
+    memory = SharedMemory(name=name)
+    try:
+        buffer = np.ndarray((count, 2), dtype=np.float64, buffer=memory.buf)
+        # copy, so the buffer can be closed while the tree still exists
+        points_rad = buffer.copy()
+        del buffer
+    finally:
+        memory.close()
+
+    return cluster_labels(points_rad, zoom)
+
+
+class ClusteringExecutor:
+    def __init__(self, processes: int) -> None:
+        self.processes = processes
+        self.memory: Optional[SharedMemory] = None
+        self.pool: Optional[ProcessPool] = None
+
+    def publish(self, points_rad: np.ndarray) -> SharedMemory:
+        """Copy positions to the shared buffer (reallocated when too small)."""
+        capacity = INITIAL_CAPACITY
+        while capacity < len(points_rad):
+            capacity *= 2
+
+        if self.memory is None or self.memory.size < capacity * 16:
+            self.release_memory()
+            self.memory = SharedMemory(create=True, size=capacity * 16)
+
+        buffer = np.ndarray(points_rad.shape, dtype=np.float64, buffer=self.memory.buf)
+        buffer[:] = points_rad
+        return self.memory
+
+    def labels(self, positions: np.ndarray, zooms: list[int]) -> list[np.ndarray]:
+        """Get cluster labels of the positions (in degrees) for each zoom."""
+        memory = self.publish(np.radians(positions))
+
+        # started after the shared memory, so the workers share its tracker
+        if self.pool is None:
+            self.pool = Pool(processes=self.processes)
+
+        return self.pool.starmap(
+            shared_labels, [(memory.name, len(positions), zoom) for zoom in zooms]
+        )
+
+    def release_memory(self) -> None:
+        if self.memory is not None:
+            self.memory.close()
+            self.memory.unlink()
+            self.memory = None
+
+    def close(self) -> None:
+        if self.pool is not None:
+            self.pool.terminate()
+            self.pool.join()
+            self.pool = None
+        self.release_memory()
+
+
+def default_processes(zooms: list[int]) -> int:
+    return min(len(zooms), cpu_count())
@@ -0,0 +1,143 @@
+"""Hierarchical grid clustering of all zoom levels in one pass.
+
+Positions are projected to Web Mercator (as displayed by the map) and
+snapped to a grid with the cell size of the zoom. Cells with at least two
+aircraft are clusters, adjacent clusters are merged (as DBSCAN chains its
+neighbourhoods) and isolated aircraft are assigned to the closest cluster
+(as the noise of DBSCAN), so the number of clusters is comparable to DBSCAN.
+
+The highest zoom groups the positions, every lower zoom groups the weighted
+centroids of the clusters of the zoom above and the still isolated
+aircraft, so the clusters are nested between zooms and each zoom costs only
+one sort of the items of the zoom above.
+"""
+from typing import Optional
+
+import numpy as np
+from scipy.sparse import coo_matrix
+from scipy.sparse.csgraph import connected_components
+from scipy.spatial import cKDTree
+
+EPS_0 = 0.1  # radians, the same scale as the DBSCAN eps
+MAX_LATITUDE = 85.05112878  # edge of the Web Mercator map
+
+
+def project(positions: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """Web Mercator coordinates (in radians) of the positions in degrees."""
+    latitude = np.radians(np.clip(positions[:, 0], -MAX_LATITUDE, MAX_LATITUDE))
+    longitude = np.radians(positions[:, 1])
+    return longitude, np.log(np.tan(np.pi / 4 + latitude / 2))
+
+
+def cell_size(zoom: int) -> float:
+    """Cell of the zoom covers the neighbourhood (2 * eps) of DBSCAN."""
+    return 2 * EPS_0 * 2 ** (-0.7 * zoom)
+
+
+def grid_columns(size: float) -> int:
+    """Number of the columns (and rows) covering the whole square map."""
+    return int(np.ceil(2 * np.pi / size)) + 2
+
+
+def cell_ids(x: np.ndarray, y: np.ndarray, size: float) -> np.ndarray:
+    """Global (stable between ticks) id of the cell of each point."""
+    columns = grid_columns(size)
+    column = np.floor(x / size).astype(np.int64) + columns // 2
+    row = np.floor(y / size).astype(np.int64) + columns // 2
+    return row * columns + column
+
+
+def cell_origins(ids: np.ndarray, size: float) -> tuple[np.ndarray, np.ndarray]:
+    """Coordinates of the lower left corner of the cells."""
+    columns = grid_columns(size)
+    row, column = np.divmod(ids, columns)
+    return (column - columns // 2) * size, (row - columns // 2) * size
+
+
+def merge_cells(ids: np.ndarray, weights: np.ndarray, size: float) -> np.ndarray:
+    """Cell of each item merged with the adjacent cells of at least two
+    aircraft, merged cells are identified by the smallest of them."""
+    cells, inverse = np.unique(ids, return_inverse=True)
+    inverse = inverse.reshape(-1)
+    dense = np.flatnonzero(np.bincount(inverse, weights, len(cells)) >= 2)
+    if len(dense) < 2:
+        return ids
+
+    # edges to the right and upper neighbours (ids are sorted)
+    dense_ids = cells[dense]
+    sources, targets = [], []
+    for offset in (1, grid_columns(size)):
+        index = np.searchsorted(dense_ids, dense_ids + offset).clip(max=len(dense) - 1)
+        adjacent = dense_ids[index] == dense_ids + offset
+        sources.append(np.flatnonzero(adjacent))
+        targets.append(index[adjacent])
+    source, target = np.concatenate(sources), np.concatenate(targets)
+    graph = coo_matrix(
+        (np.ones(len(source)), (source, target)), shape=(len(dense), len(dense))
+    )
+    _, components = connected_components(graph, directed=False)
+
+    # the first cell of each component is the smallest one
+    _, first = np.unique(components, return_index=True)
+    merged = cells.copy()
+    merged[dense] = dense_ids[first][components]
+    return merged[inverse]
+
+
+def closest_clusters(x: np.ndarray, y: np.ndarray, weights: np.ndarray) -> np.ndarray:
+    """Index of the cluster of each item, isolated aircraft (weight 1) are
+    assigned to the closest item of at least two aircraft."""
+    output = np.arange(len(weights))
+    clusters = np.flatnonzero(weights >= 2)
+    isolated = np.flatnonzero(weights < 2)
+    if not len(clusters) or not len(isolated):
+        return output
+
+    # x is periodic (antimeridian), y is shifted into the (non-periodic) box
+    def points(index: np.ndarray) -> np.ndarray:
+        return np.column_stack(
+            (np.mod(x[index] + np.pi, 2 * np.pi), y[index] + 2 * np.pi)
+        )
+
+    tree = cKDTree(points(clusters), boxsize=(2 * np.pi, 4 * np.pi))
+    _, nearest = tree.query(points(isolated))
+    output[isolated] = clusters[nearest]
+    return output
+
+
+def grid_labels(
+    positions: np.ndarray, zooms: list[int], cells: Optional[np.ndarray] = None
+) -> list[np.ndarray]:
+    """Get cluster label of each position (in degrees) for each zoom.
+
+    `cells` of the positions in the highest zoom replace the cells of their
+    positions (e.g. cells kept from the previous tick).
+    """
+    if not len(positions):
+        return [np.empty(0, dtype=np.int64) for _ in zooms]
+
+    x, y = project(positions)
+    weights: np.ndarray = np.ones(len(positions))
+    # item (cluster or isolated aircraft) of each position on the current level
+    labels: np.ndarray = np.arange(len(positions))
+    zoom_labels: dict[int, np.ndarray] = {}
+
+    for zoom in sorted(zooms, reverse=True):
+        size = cell_size(zoom)
+        ids = cell_ids(x, y, size) if cells is None else cells
+        cells = None
+        _, parents = np.unique(merge_cells(ids, weights, size), return_inverse=True)
+        parents = parents.reshape(-1)
+        count = int(parents.max()) + 1
+
+        # weighted centroids of the merged items
+        parent_weights = np.bincount(parents, weights, count)
+        x = np.bincount(parents, weights * x, count) / parent_weights
+        y = np.bincount(parents, weights * y, count) / parent_weights
+        weights = parent_weights
+
+        labels = parents[labels]
+        # isolated aircraft stay on their own for the lower zooms
+        zoom_labels[zoom] = closest_clusters(x, y, weights)[labels]
+
+    return [zoom_labels[zoom] for zoom in zooms]
@@ -0,0 +1,118 @@
+"""Grid clustering with cluster ids that are stable between ticks.
+
+Clusters are built by `clustering.grid`, so they are the same as of the
+"grid" engine. Every cluster keeps the id that most of its aircraft had in
+the previous tick (a split cluster keeps it for the bigger part), other
+clusters get new ids, so clients can diff the clusters by them. An
+aircraft leaves its cell of the highest zoom only when it gets further
+than `HYSTERESIS` of the cell behind its edge, so aircraft near the edges
+do not jump between clusters back and forth.
+
+The work is not incremental: the published flights are those with a new
+position in the tick, so all of them are clustered again in every tick
+(vectorized, aligned with the previous tick by a sort of the keys).
+"""
+import numpy as np
+
+from .grid import cell_ids, cell_origins, cell_size, grid_labels, project
+
+HYSTERESIS = 0.25  # of the cell size
+
+
+class StableGrid:
+    def __init__(self) -> None:
+        self.reset([])
+
+    def reset(self, zooms: list[int]) -> None:
+        # cells (of the highest zoom) and cluster ids of the previous tick
+        # ordered by the keys
+        self.keys = np.empty(0, dtype=str)
+        self.cells = np.empty(0, dtype=np.int64)
+        self.ids = np.empty((0, len(zooms)), dtype=np.int64)
+        self.zooms = list(zooms)
+        self.next_id = 0
+
+    def previous(self, keys: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        """Cell and cluster ids of the aircraft in the previous tick (-1 for
+        new aircraft)."""
+        cells = np.full(len(keys), -1, dtype=np.int64)
+        ids = np.full((len(keys), len(self.zooms)), -1, dtype=np.int64)
+        if not len(self.keys):
+            return cells, ids
+
+        index = np.searchsorted(self.keys, keys).clip(max=len(self.keys) - 1)
+        known = self.keys[index] == keys
+        cells[known] = self.cells[index[known]]
+        ids[known] = self.ids[index[known]]
+        return cells, ids
+
+    def assign(
+        self, x: np.ndarray, y: np.ndarray, previous: np.ndarray, size: float
+    ) -> np.ndarray:
+        """Keep previous cells (-1 for new aircraft) of the points still close."""
+        cells = cell_ids(x, y, size)
+        known = previous >= 0
+
+        left, bottom = cell_origins(previous[known], size)
+        margin = HYSTERESIS * size
+        close = (
+            (left - margin <= x[known])
+            & (x[known] < left + size + margin)
+            & (bottom - margin <= y[known])
+            & (y[known] < bottom + size + margin)
+        )
+        cells[np.flatnonzero(known)[close]] = previous[known][close]
+        return cells
+
+    def match(self, labels: np.ndarray, previous: np.ndarray) -> np.ndarray:
+        """Id of the cluster of each aircraft, clusters take the previous id
+        (-1 for new aircraft) of most of their aircraft, the biggest first."""
+        clusters, inverse = np.unique(labels, return_inverse=True)
+        inverse = inverse.reshape(-1)
+        ids = np.full(len(clusters), -1, dtype=np.int64)
+
+        known = previous >= 0
+        if known.any():
+            # pairs (cluster, previous id) encoded as one number
+            base = int(previous.max()) + 1
+            pairs, counts = np.unique(
+                inverse[known] * base + previous[known], return_counts=True
+            )
+            cluster, previous_id = np.divmod(
+                pairs[np.argsort(-counts, kind="stable")], base
+            )
+            # the most frequent id of every cluster, every id used once
+            _, first = np.unique(cluster, return_index=True)
+            first = np.sort(first)
+            cluster, previous_id = cluster[first], previous_id[first]
+            _, first = np.unique(previous_id, return_index=True)
+            ids[cluster[first]] = previous_id[first]
+
+        new = np.flatnonzero(ids < 0)
+        ids[new] = np.arange(self.next_id, self.next_id + len(new))
+        self.next_id += len(new)
+        return ids[inverse]
+
+    def labels(
+        self, keys: np.ndarray, positions: np.ndarray, zooms: list[int]
+    ) -> list[np.ndarray]:
+        """Get cluster of each aircraft (position in degrees) for each zoom."""
+        if zooms != self.zooms:
+            self.reset(zooms)
+
+        previous_cells, previous_ids = self.previous(keys)
+        x, y = project(positions)
+        cells = self.assign(x, y, previous_cells, cell_size(max(zooms)))
+        ids = np.column_stack(
+            [
+                self.match(labels, previous_ids[:, column])
+                for column, labels in enumerate(grid_labels(positions, zooms, cells))
+            ]
+        ).reshape(len(keys), len(zooms))
+
+        order = np.argsort(keys)
+        self.keys = keys[order]
+        self.cells = cells[order]
+        self.ids = ids[order]
+
+        return [ids[:, column] for column in range(len(zooms))]
@@ -0,0 +1,104 @@
+"""Index of the published clusters (or flights) by slippy map tiles.
+
+Items are put into the tile (z/x/y) of their position. A viewport query
+visits only the tiles it overlaps, so its cost scales with the number of
+the visible items and not with the whole fleet.
+"""
+from collections import defaultdict
+from typing import Generic, Iterator, TypeVar
+
+import numpy as np
+
+from .grid import MAX_LATITUDE
+
+T = TypeVar("T")
+
+# (west, south, east, north) in degrees
+BoundingBox = tuple[float, float, float, float]
+
+
+def tile_columns(longitude: np.ndarray, zoom: int) -> np.ndarray:
+    tiles = 2**zoom
+    column = np.floor((longitude + 180) / 360 * tiles).astype(np.int64)
+    return np.clip(column, 0, tiles - 1)
+
+
+def tile_rows(latitude: np.ndarray, zoom: int) -> np.ndarray:
+    tiles = 2**zoom
+    latitude = np.radians(np.clip(latitude, -MAX_LATITUDE, MAX_LATITUDE))
+    y = (1 - np.log(np.tan(latitude) + 1 / np.cos(latitude)) / np.pi) / 2
+    return np.clip(np.floor(y * tiles).astype(np.int64), 0, tiles - 1)
+
+
+def pad(bbox: BoundingBox, margin: float) -> BoundingBox:
+    """Bounding box enlarged by the margin (in degrees) on every side."""
+    west, south, east, north = bbox
+    return (
+        west - margin,
+        max(south - margin, -90.0),
+        east + margin,
+        min(north + margin, 90.0),
+    )
+
+
+def split_antimeridian(bbox: BoundingBox) -> list[BoundingBox]:
+    """Bounding boxes within <-180, 180> covering the (possibly wrapped) box."""
+    west, south, east, north = bbox
+    if east - west >= 360:
+        return [(-180.0, south, 180.0, north)]
+
+    # map can be panned around the globe (e.g. east 200)
+    west = (west + 180) % 360 - 180
+    east = (east + 180) % 360 - 180
+    if west <= east:
+        return [(west, south, east, north)]
+    return [(west, south, 180.0, north), (-180.0, south, east, north)]
+
+
+class TileIndex(Generic[T]):
+    def __init__(self, items: list[T], positions: np.ndarray, zoom: int) -> None:
+        """Index items by the tiles of their positions (latitude, longitude)."""
+        self.zoom = zoom
+        self.items = items
+        self.positions = positions.reshape(-1, 2)
+        self.tiles: dict[tuple[int, int], list[int]] = defaultdict(list)
+
+        columns = tile_columns(self.positions[:, 1], zoom).tolist()
+        rows = tile_rows(self.positions[:, 0], zoom).tolist()
+        for index, tile in enumerate(zip(columns, rows)):
+            self.tiles[tile].append(index)
+
+    def __len__(self) -> int:
+        return len(self.items)
+
+    def candidates(self, bbox: BoundingBox) -> Iterator[int]:
+        """Indexes of the items in the tiles overlapping the bounding box."""
+        west, south, east, north = bbox
+        columns = tile_columns(np.array([west, east]), self.zoom).tolist()
+        # rows are numbered from the north
+        rows = tile_rows(np.array([north, south]), self.zoom).tolist()
+
+        if (columns[1] - columns[0] + 1) * (rows[1] - rows[0] + 1) > len(self.tiles):
+            for indexes in self.tiles.values():
+                yield from indexes
+            return
+
+        for column in range(columns[0], columns[1] + 1):
+            for row in range(rows[0], rows[1] + 1):
+                yield from self.tiles.get((column, row), ())
+
+    def query(self, bbox: BoundingBox) -> list[T]:
+        """Get items with position within the bounding box."""
+        output: list[T] = []
+        for part in split_antimeridian(bbox):
+            indexes = np.fromiter(self.candidates(part), dtype=np.int64)
+            latitude, longitude = self.positions[indexes].T
+            west, south, east, north = part
+            visible = (
+                (south <= latitude)
+                & (latitude <= north)
+                & (west <= longitude)
+                & (longitude <= east)
+            )
+            output.extend(self.items[i] for i in indexes[visible].tolist())
+        return output
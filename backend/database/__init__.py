@@ -1,13 +1,276 @@
+from datetime import datetime
 from time import sleep
+from typing import Any, Callable, Iterator, Sequence, Unpack
 
 from airports import db_insert_airports
-from sqlalchemy import inspect
+from sqlalchemy import (
+    Column,
+    Connection,
+    DateTime,
+    PickleType,
+    Row,
+    Table,
+    TableClause,
+    bindparam,
+    column,
+    delete,
+    insert,
+    inspect,
+    literal,
+    select,
+    table,
+    text,
+    update,
+)
 
-from .models import TABLES, Base
+from .models import (
+    LAST_CONTACT_COLUMNS,
+    TABLES,
+    Base,
+    Flight,
+    Timestamp,
+    Track,
+    association_table,
+    schema_version,
+    table_of,
+)
+from .partitions import partition_timestamps
 from .session import engine, is_ready
 
 TABLE_NAMES = [table.__tablename__ for table in TABLES]
 
+MIGRATION_BATCH = 5000  # rows
+
+
+def add_column(connection: Connection, new_column: Column, backfill: Any = 0) -> None:
+    """Add column of the model into the existing table.
+
+    Existing rows get `backfill` in the NOT NULL columns (until migrated).
+    """
+    table_name = new_column.table.name
+    # migration could fail after the column was added (DDL is not transactional)
+    if new_column.name in table_columns(connection, table_name):
+        return
+
+    definition = f"{new_column.name} {new_column.type.compile(connection.dialect)}"
+    if not new_column.nullable:
+        value = literal(backfill, new_column.type).compile(
+            dialect=connection.dialect, compile_kwargs={"literal_binds": True}
+        )
+        definition += f" NOT NULL DEFAULT {value}"
+
+    connection.execute(text(f"ALTER TABLE {table_name} ADD COLUMN {definition}"))
+
+    # the default is only for the existing rows (SQLite can not drop it)
+    if not new_column.nullable and connection.dialect.name != "sqlite":
+        connection.execute(
+            text(
+                f"ALTER TABLE {table_name} ALTER COLUMN {new_column.name} DROP DEFAULT"
+            )
+        )
+
+
+def create_indexes(connection: Connection, model_table: Table, *names: str) -> None:
+    """Create indexes of the model that are missing in the existing table."""
+    existing = {
+        index["name"] for index in inspect(connection).get_indexes(model_table.name)
+    }
+    for index in model_table.indexes:
+        if index.name in names and index.name not in existing:
+            index.create(connection)
+
+
+def batches(
+    connection: Connection, source: TableClause
+) -> Iterator[Sequence[Row[Unpack[tuple[Any, ...]]]]]:
+    """Read all rows of the table in batches (ordered by id)."""
+    last_id = 0
+    while rows := connection.execute(
+        select(source)
+        .where(source.c.id > last_id)
+        .order_by(source.c.id)
+        .limit(MIGRATION_BATCH)
+    ).all():
+        yield rows
+        last_id = rows[-1][0]
+
+
+def create_missing_tables(connection: Connection) -> None:
+    """Create tables that are missing in the existing database."""
+    Base.metadata.create_all(connection)
+
+
+def migrate_last_contact_info(connection: Connection) -> None:
+    """Move pickled `last_contact_info` of the flights into the native columns."""
+    if "last_contact_info" not in flight_columns(connection):
+        return
+
+    flight = table_of(Flight)
+    pickled = table("flight", column("id"), column("last_contact_info", PickleType))
+
+    for name in LAST_CONTACT_COLUMNS:
+        add_column(connection, flight.c[name])
+
+    statement = (
+        update(flight)
+        .where(flight.c.id == bindparam("b_id"))
+        .values({name: bindparam(name) for name in LAST_CONTACT_COLUMNS})
+    )
+
+    for rows in batches(connection, pickled):
+        connection.execute(
+            statement,
+            [{"b_id": id, **info.to_dict()} for id, info in rows],
+        )
+
+    connection.execute(text("ALTER TABLE flight DROP COLUMN last_contact_info"))
+
+
+def migrate_record_columns(connection: Connection) -> None:
+    """Store first and last record of the flights as unix timestamps."""
+    # every step can be repeated (migration failed after the DDL on MySQL)
+    old_columns = {"_first_record", "_last_record"} & flight_columns(connection)
+    if len(old_columns) == 2:
+        migrate_record_dates(connection)
+
+    for name in sorted(old_columns):
+        connection.execute(text(f"ALTER TABLE flight DROP COLUMN {name}"))
+
+    create_indexes(
+        connection,
+        table_of(Flight),
+        "ix_flight_first_record",
+        "ix_flight_last_record",
+    )
+
+
+def migrate_record_dates(connection: Connection) -> None:
+    """Copy the dates of the records into the unix timestamps."""
+    flight = table_of(Flight)
+    dates = table(
+        "flight",
+        column("id"),
+        column("_first_record", DateTime),
+        column("_last_record", DateTime),
+    )
+
+    add_column(connection, flight.c.first_record)
+    add_column(connection, flight.c.last_record)
+
+    statement = (
+        update(flight)
+        .where(flight.c.id == bindparam("b_id"))
+        .values(
+            first_record=bindparam("first_record"),
+            last_record=bindparam("last_record"),
+        )
+    )
+
+    # dates were stored in the local time (datetime.fromtimestamp)
+    for rows in batches(connection, dates):
+        connection.execute(
+            statement,
+            [
+                {
+                    "b_id": id,
+                    "first_record": int(datetime.timestamp(first)),
+                    "last_record": int(datetime.timestamp(last)),
+                }
+                for id, first, last in rows
+            ],
+        )
+
+
+def add_hot_query_indexes(connection: Connection) -> None:
+    """Add composite indexes of the hot queries."""
+    create_indexes(
+        connection,
+        table_of(Flight),
+        "ix_flight_ended_has_record",
+        "ix_flight_callsign_first_record",
+        "ix_flight_has_record_ended_last_record",
+        "ix_flight_aircraft_icao24_callsign_first_record",
+    )
+    create_indexes(connection, table_of(Timestamp), "ix_timestamp_flight_id_timestamp")
+
+
+def add_retention_indexes(connection: Connection) -> None:
+    """Add indexes of the set-based removal of the flights."""
+    create_indexes(connection, association_table, "ix_association_table_flight_id")
+
+
+def create_tracks(connection: Connection) -> None:
+    """Create table of the compacted tracks."""
+    table_of(Track).create(connection, checkfirst=True)
+
+
+def add_airport_flights_index(connection: Connection) -> None:
+    """Add index of the flights detected at the airport."""
+    create_indexes(connection, association_table, "ix_association_table_airport_id")
+
+
+# applied in order, version of the schema is the number of applied migrations
+# (never change or remove already released migration, append a new one)
+MIGRATIONS: list[Callable[[Connection], None]] = [
+    create_missing_tables,
+    migrate_last_contact_info,
+    migrate_record_columns,
+    add_hot_query_indexes,
+    add_retention_indexes,
+    partition_timestamps,
+    create_tracks,
+    add_airport_flights_index,
+]
+
+
+def table_columns(connection: Connection, table_name: str) -> set[str]:
+    return {c["name"] for c in inspect(connection).get_columns(table_name)}
+
+
+def flight_columns(connection: Connection) -> set[str]:
+    return table_columns(connection, "flight")
+
+
+def get_version(connection: Connection) -> int:
+    """Get version of the schema (0 for databases created before migrations)."""
+    if not inspect(connection).has_table(schema_version.name):
+        return 0
+    return connection.execute(select(schema_version.c.version)).scalar() or 0
+
+
+def set_version(connection: Connection, version: int) -> None:
+    schema_version.create(connection, checkfirst=True)
+    connection.execute(delete(schema_version))
+    connection.execute(insert(schema_version).values(version=version))
+
+
+def upgrade_schema() -> bool:
+    """Create or migrate schema to the newest version.
+
+    Returns True if the schema was created (database was empty).
+    """
+    tables = set(inspect(engine).get_table_names())
+
+    if not tables & set(TABLE_NAMES):
+        with engine.begin() as connection:
+            Base.metadata.create_all(connection)
+            # partitions are not part of the models
+            partition_timestamps(connection)
+            set_version(connection, len(MIGRATIONS))
+        return True
+
+    with engine.connect() as connection:
+        version = get_version(connection)
+
+    # every migration is committed with its version
+    for version, migration in enumerate(MIGRATIONS[version:], version + 1):
+        print(f"Migrating database to version {version}: {migration.__doc__}")
+        with engine.begin() as connection:
+            migration(connection)
+            set_version(connection, version)
+
+    return False
+
 
 def init_db() -> None:
     """Initialze database."""
@@ -15,11 +278,5 @@ def init_db() -> None:
         print("Wainting for database to be ready...")
         sleep(1)
 
-    inspection = inspect(engine)
-    tables = inspection.get_table_names()
-
-    # initialize only when tables are non existing
-    if len(set(TABLE_NAMES) - set(tables)) != 0:
-        Base.metadata.drop_all(engine)
-        Base.metadata.create_all(engine)
+    if upgrade_schema():
         db_insert_airports()
@@ -1,13 +1,26 @@
-from datetime import datetime
-from typing import Optional
-
-from sqlalchemy import Column, ForeignKey, PickleType, String, Table
+from typing import Optional, cast
+
+from sqlalchemy import (
+    Column,
+    ForeignKey,
+    Index,
+    Integer,
+    LargeBinary,
+    String,
+    Table,
+)
 from sqlalchemy.ext.hybrid import hybrid_method
-from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column, relationship
+from sqlalchemy.orm import (
+    DeclarativeBase,
+    Mapped,
+    composite,
+    mapped_column,
+    relationship,
+)
 
 
 # This is just used for better structure
-# all properties can be used directly in the Flight table
+# all properties are stored directly in the Flight table (composite)
 class LastContactInfo:
     """Last contact information."""
 
@@ -31,18 +44,63 @@ class LastContactInfo:
     def position(self) -> tuple[float, float]:
         return self.latitude, self.longitude
 
+    def __composite_values__(self) -> tuple[Optional[float], ...]:
+        return (
+            self.latitude,
+            self.longitude,
+            self.track_angle,
+            self.vertical_rate,
+            self.velocity,
+            self.altitude,
+        )
+
+    def __eq__(self, other: object) -> bool:
+        return (
+            isinstance(other, LastContactInfo)
+            and self.__composite_values__() == other.__composite_values__()
+        )
+
+    def __hash__(self) -> int:
+        return hash(self.__composite_values__())
+
+    def to_dict(self) -> dict[str, Optional[float]]:
+        """Get values of the columns."""
+        return dict(zip(LAST_CONTACT_COLUMNS, self.__composite_values__()))
+
+
+LAST_CONTACT_COLUMNS = (
+    "latitude",
+    "longitude",
+    "track_angle",
+    "vertical_rate",
+    "velocity",
+    "altitude",
+)
+
 
 class Base(DeclarativeBase):
     ...
 
 
+def table_of(model: type[Base]) -> Table:
+    """Table of the model (`__table__` is typed only as a FromClause)."""
+    return cast(Table, model.__table__)
+
+
 # note for a Core table, we use the sqlalchemy.Column construct,
 # not sqlalchemy.orm.mapped_column
 association_table = Table(
     "association_table",
     Base.metadata,
-    Column("airport_id", ForeignKey("airport.id", ondelete="CASCADE")),
-    Column("flight_id", ForeignKey("flight.id", ondelete="CASCADE")),
+    Column("airport_id", ForeignKey("airport.id", ondelete="CASCADE"), index=True),
+    Column("flight_id", ForeignKey("flight.id", ondelete="CASCADE"), index=True),
+)
+
+# version of the schema (number of applied migrations)
+schema_version = Table(
+    "schema_version",
+    Base.metadata,
+    Column("version", Integer, nullable=False),
 )
 
 
@@ -75,10 +133,28 @@ class Aircraft(Base):
     flights: Mapped[list["Flight"]] = relationship(cascade="all")
 
 
-# TODO: consider storing first and last record as int
-# since there is a lot of conversion in the code, (very inconsistent)
 class Flight(Base):
     __tablename__ = "flight"
+    __table_args__ = (
+        # active flights (with records)
+        Index("ix_flight_ended_has_record", "ended", "has_record"),
+        # flights matched to the recordings
+        Index("ix_flight_callsign_first_record", "callsign", "first_record"),
+        # flights with records, removal of the ended flights without them
+        Index(
+            "ix_flight_has_record_ended_last_record",
+            "has_record",
+            "ended",
+            "last_record",
+        ),
+        # ids of the inserted flights
+        Index(
+            "ix_flight_aircraft_icao24_callsign_first_record",
+            "aircraft_icao24",
+            "callsign",
+            "first_record",
+        ),
+    )
 
     id: Mapped[int] = mapped_column(primary_key=True)
     aircraft_icao24: Mapped[str] = mapped_column(
@@ -86,54 +162,55 @@ class Flight(Base):
     )
 
     callsign: Mapped[str] = mapped_column(String(8), nullable=False)
-    _first_record: Mapped[datetime] = mapped_column(nullable=False)
-    _last_record: Mapped[datetime] = mapped_column(nullable=False)
+    # unix timestamps (seconds)
+    first_record: Mapped[int] = mapped_column(nullable=False, index=True)
+    last_record: Mapped[int] = mapped_column(nullable=False, index=True)
     ended: Mapped[bool] = mapped_column(default=False)
     has_record: Mapped[bool] = mapped_column(nullable=False, default=False)
-    last_contact_info: Mapped[LastContactInfo] = mapped_column(
-        PickleType, nullable=False
-    )
+    latitude: Mapped[float] = mapped_column(nullable=False)
+    longitude: Mapped[float] = mapped_column(nullable=False)
+    track_angle: Mapped[float] = mapped_column(nullable=False)
+    vertical_rate: Mapped[Optional[float]] = mapped_column(nullable=True)
+    velocity: Mapped[Optional[float]] = mapped_column(nullable=True)
+    altitude: Mapped[Optional[float]] = mapped_column(nullable=True)
+    last_contact_info: Mapped[LastContactInfo] = composite(*LAST_CONTACT_COLUMNS)
     airports: Mapped[list[Airport]] = relationship(
         secondary=association_table, back_populates="detected_flights"
     )
-    timestamps: Mapped[list["Timestamp"]] = relationship(cascade="all, delete")
+    timestamps: Mapped[list["Timestamp"]] = relationship(
+        cascade="all, delete", order_by="Timestamp.timestamp"
+    )
+    # compacted timestamps of the ended flight
+    track: Mapped[Optional["Track"]] = relationship(cascade="all, delete")
 
     def add_timestamp(self, timestamp: "Timestamp") -> None:
         self.timestamps.append(timestamp)
 
-    @property
-    def first_record(self) -> int:
-        return int(datetime.timestamp(self._first_record))
-
-    @first_record.setter
-    def first_record(self, timestamp):
-        self._first_record = datetime.fromtimestamp(timestamp)
-
-    @property
-    def last_record(self) -> int:
-        return int(datetime.timestamp(self._last_record))
-
-    @last_record.setter
-    def last_record(self, timestamp):
-        self._last_record = datetime.fromtimestamp(timestamp)
-
     def update_last_contact(self, info: LastContactInfo) -> None:
         self.last_contact_info = info
 
     @hybrid_method
     def within_interval(self, start: int, end: int) -> bool:
-        d_start = datetime.fromtimestamp(start)
-        d_end = datetime.fromtimestamp(end)
-        return ((self._first_record <= d_end) & (d_end <= self._last_record)) | (
-            (self._first_record <= d_start) & (d_start <= self._last_record)
+        # both cases imply the range of the last record, which is the only
+        # condition that can use an index (most flights ended long before),
+        # a bound of the first record would let the planner pick its index
+        return (start <= self.last_record) & (
+            ((self.first_record <= end) & (end <= self.last_record))
+            | ((self.first_record <= start) & (start <= self.last_record))
         )
 
     def end(self):
         self.ended = True
 
 
+# on MySQL the table is partitioned by time (see database.partitions),
+# the foreign key is dropped there and primary key is (id, timestamp)
 class Timestamp(Base):
     __tablename__ = "timestamp"
+    __table_args__ = (
+        # timestamps of the flight (ordered)
+        Index("ix_timestamp_flight_id_timestamp", "flight_id", "timestamp"),
+    )
 
     id: Mapped[int] = mapped_column(primary_key=True)
     flight_id: Mapped[int] = mapped_column(ForeignKey("flight.id", ondelete="CASCADE"))
@@ -152,4 +229,20 @@ class Timestamp(Base):
         return self.latitude, self.longitude
 
 
-TABLES: list[type[Base]] = [Airport, Aircraft, Flight, Timestamp]
+class Track(Base):
+    """Whole track of the ended flight (see database.track).
+
+    Timestamps of the flight are removed when the track is created, except
+    the ones with recordings.
+    """
+
+    __tablename__ = "track"
+
+    flight_id: Mapped[int] = mapped_column(
+        ForeignKey("flight.id", ondelete="CASCADE"), primary_key=True
+    )
+    # MEDIUMBLOB on MySQL
+    data: Mapped[bytes] = mapped_column(LargeBinary(2**24 - 1), nullable=False)
+
+
+TABLES: list[type[Base]] = [Airport, Aircraft, Flight, Timestamp, Track]
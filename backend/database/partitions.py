@@ -0,0 +1,143 @@
+"""Daily RANGE partitions of the `timestamp` table (MySQL only).
+
+Old timestamps are removed by dropping whole partitions, which takes the same
+time regardless of the number of rows. Partitioned InnoDB tables can not have
+foreign keys and their primary key has to contain the partitioning column, so
+`flight_id` is only indexed and the primary key is (id, timestamp).
+"""
+import time
+from datetime import datetime, timezone
+
+from sqlalchemy import Connection, inspect, text
+
+from .session import engine
+
+TABLE = "timestamp"
+PARTITION_INTERVAL = 24 * 3600  # one day
+PARTITIONS_AHEAD = 3  # days
+MAXVALUE = "pmax"  # catch-all partition, kept empty
+
+
+def is_supported(connection: Connection) -> bool:
+    return connection.dialect.name == "mysql"
+
+
+def partition_name(start: int) -> str:
+    """Name of the partition with timestamps starting at `start`."""
+    return "p" + datetime.fromtimestamp(start, tz=timezone.utc).strftime("%Y%m%d")
+
+
+def day_start(timestamp: int) -> int:
+    return timestamp - timestamp % PARTITION_INTERVAL
+
+
+def get_partitions(connection: Connection) -> dict[str, int]:
+    """Get partitions of the table with their (exclusive) upper bounds."""
+    rows = connection.execute(
+        text(
+            "SELECT partition_name, partition_description FROM information_schema.partitions "
+            "WHERE table_schema = DATABASE() AND table_name = :table "
+            "AND partition_name IS NOT NULL"
+        ),
+        {"table": TABLE},
+    )
+    return {name: int(bound) if bound != "MAXVALUE" else -1 for name, bound in rows}
+
+
+def is_partitioned(connection: Connection) -> bool:
+    return is_supported(connection) and bool(get_partitions(connection))
+
+
+def partition_definitions(start: int, end: int) -> str:
+    """Daily partitions covering <start, end) with the catch-all partition."""
+    return ", ".join(
+        [
+            f"PARTITION {partition_name(day)} VALUES LESS THAN ({day + PARTITION_INTERVAL})"
+            for day in range(day_start(start), end, PARTITION_INTERVAL)
+        ]
+        + [f"PARTITION {MAXVALUE} VALUES LESS THAN MAXVALUE"]
+    )
+
+
+def partition_timestamps(connection: Connection) -> None:
+    """Partition the timestamps by time (MySQL only)."""
+    if not is_supported(connection) or is_partitioned(connection):
+        return
+
+    for foreign_key in inspect(connection).get_foreign_keys(TABLE):
+        connection.execute(
+            text(f"ALTER TABLE `{TABLE}` DROP FOREIGN KEY {foreign_key['name']}")
+        )
+
+    now = int(time.time())
+    first = connection.execute(text(f"SELECT MIN(`timestamp`) FROM `{TABLE}`")).scalar()
+    connection.execute(
+        text(
+            f"ALTER TABLE `{TABLE}` DROP PRIMARY KEY, ADD PRIMARY KEY (id, `timestamp`) "
+            f"PARTITION BY RANGE (`timestamp`) ("
+            f"{partition_definitions(first or now, day_start(now) + PARTITIONS_AHEAD * PARTITION_INTERVAL)})"
+        )
+    )
+
+
+def add_partitions(connection: Connection, until: int) -> None:
+    """Split partitions covering days before `until` from the catch-all partition."""
+    bounds = [bound for bound in get_partitions(connection).values() if bound > 0]
+    start = max(bounds) if bounds else day_start(int(time.time()))
+    if start >= until:
+        return
+
+    # the catch-all partition is empty, so reorganizing it is instant
+    connection.execute(
+        text(
+            f"ALTER TABLE `{TABLE}` REORGANIZE PARTITION {MAXVALUE} INTO "
+            f"({partition_definitions(start, until)})"
+        )
+    )
+
+
+def drop_partitions(connection: Connection, before: int) -> list[str]:
+    """Drop partitions that contain only timestamps older than `before`."""
+    names = [
+        name
+        for name, bound in get_partitions(connection).items()
+        if 0 < bound <= before
+    ]
+    if names:
+        connection.execute(
+            text(f"ALTER TABLE `{TABLE}` DROP PARTITION {', '.join(names)}")
+        )
+    return names
+
+
+def retention_boundary(old: int) -> int:
+    """Partitions below the boundary can be dropped, they contain only timestamps
+    of the flights ended before `old` (0 if the timestamps are not partitioned).
+
+    Flights that are kept can start days before `old` (e.g. a recorded flight
+    over midnight), their timestamps have to stay.
+    """
+    with engine.connect() as connection:
+        if not is_partitioned(connection):
+            return 0
+        first = connection.execute(
+            text("SELECT MIN(first_record) FROM flight WHERE last_record >= :old"),
+            {"old": old},
+        ).scalar()
+    return day_start(min(old, first if first is not None else old))
+
+
+def maintain_partitions(before: int) -> list[str]:
+    """Drop partitions before the boundary and add partitions for the next days.
+
+    Returns names of the dropped partitions.
+    """
+    with engine.begin() as connection:
+        if not is_partitioned(connection):
+            return []
+
+        add_partitions(
+            connection,
+            day_start(int(time.time())) + (PARTITIONS_AHEAD + 1) * PARTITION_INTERVAL,
+        )
+        return drop_partitions(connection, before)
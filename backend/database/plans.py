@@ -0,0 +1,108 @@
+"""Query plan check of the hot queries.
+
+Runs the hot queries of the `Session` against the configured database
+(DATABASE_URL), explains the emitted SQL and fails when any of them reads a
+whole table. The schema is upgraded first, an empty SQLite database is
+enough to check the indexes.
+
+Run from the backend directory: python -m database.plans
+"""
+import re
+import sys
+from typing import Any, Callable
+
+from sqlalchemy import Connection, event, select
+
+from database import upgrade_schema
+from database.models import Timestamp
+from database.session import Session, engine
+
+HOT_QUERIES: dict[str, Callable[[Session], Any]] = {
+    "active flights": lambda session: session.get_active_flights(),
+    "active recorded flights": lambda session: (
+        session.get_active_recorded_flights_ids()
+    ),
+    "flights in interval": lambda session: session.get_flights_in_interval(
+        ("CSA123  ",), 0, 600
+    ),
+    "flights with record": lambda session: session.get_flight_with_records(
+        profile="airports"
+    ),
+    "flights of airport": lambda session: session.get_flight_from_airport(
+        1, profile="info"
+    ),
+    "records of flight": lambda session: session.get_flight(1, profile="records"),
+    "flights with record in interval": lambda session: (
+        session.get_flights_with_record_interval(0, 600)
+    ),
+    "old flights": lambda session: session.get_old_flights(0, 0, limit=500),
+    "files of old flights": lambda session: session.get_records_files([0]),
+    "delete old timestamps": lambda session: session.delete_timestamps([0], 5000),
+    "delete old flights": lambda session: session.delete_flights([0]),
+    "flights to compact": lambda session: session.get_flights_to_compact(0, 50),
+    # same as the lazy load of Flight.timestamps
+    "timestamps of flight": lambda session: session.session.execute(
+        select(Timestamp).where(Timestamp.flight_id == 1).order_by(Timestamp.timestamp)
+    ).all(),
+}
+
+# SQLite: "SCAN flight", MySQL: access type ALL (table) or index (whole index)
+SQLITE_SCAN = re.compile(r"^SCAN (?!CONSTANT ROW)")
+MYSQL_SCANS = ("ALL", "index")
+
+
+def capture(query: Callable[[Session], Any]) -> list[tuple[str, Any]]:
+    """Get SQL statements (with parameters) emitted by the query."""
+    statements: list[tuple[str, Any]] = []
+
+    def before_execute(conn, cursor, statement, parameters, context, executemany):
+        statements.append((statement, parameters))
+
+    event.listen(engine, "before_cursor_execute", before_execute)
+    session = Session()
+    try:
+        query(session)
+    finally:
+        session.close()
+        event.remove(engine, "before_cursor_execute", before_execute)
+
+    return statements
+
+
+def full_scans(connection: Connection, statement: str, parameters: Any) -> list[str]:
+    """Explain the statement and get steps reading whole table."""
+    if connection.dialect.name == "sqlite":
+        plan = connection.exec_driver_sql(
+            f"EXPLAIN QUERY PLAN {statement}", parameters
+        ).all()
+        return [row.detail for row in plan if SQLITE_SCAN.match(row.detail)]
+
+    steps = connection.exec_driver_sql(f"EXPLAIN {statement}", parameters).mappings()
+    return [
+        f"{step['table']} ({step['type']})"
+        for step in steps
+        if step["type"] in MYSQL_SCANS
+    ]
+
+
+def main() -> int:
+    upgrade_schema()
+
+    failed = False
+    with engine.connect() as connection:
+        for name, query in HOT_QUERIES.items():
+            scans = [
+                scan
+                for statement, parameters in capture(query)
+                for scan in full_scans(connection, statement, parameters)
+            ]
+            failed |= bool(scans)
+            print(f"{'FULL SCAN' if scans else 'OK':<10} {name}")
+            for scan in scans:
+                print(f"    {scan}")
+
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
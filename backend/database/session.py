@@ -1,13 +1,40 @@
 import logging
 import os
-from datetime import datetime
-from functools import wraps
-from typing import Any, Iterable, Optional
-
-from database.models import Aircraft, Airport, Flight, Timestamp
-from sqlalchemy import create_engine, or_
+from functools import partial, wraps
+from typing import Any, Iterable, Optional, cast
+
+from database.models import (
+    Aircraft,
+    Airport,
+    Base,
+    Flight,
+    Timestamp,
+    Track,
+    association_table,
+    table_of,
+)
+from database.track import TrackPoint, encode_track, simplify
+from sqlalchemy import (
+    CursorResult,
+    Engine,
+    create_engine,
+    delete,
+    event,
+    insert,
+    make_url,
+    or_,
+    text,
+)
 from sqlalchemy.exc import OperationalError
-from sqlalchemy.orm import scoped_session, sessionmaker
+from sqlalchemy.orm import (
+    joinedload,
+    load_only,
+    raiseload,
+    scoped_session,
+    selectinload,
+    sessionmaker,
+)
+from sqlalchemy.orm.interfaces import ORMOption
 
 MYSQL_HOST = "127.0.0.1"
 MYSQL_USER = "root"
@@ -17,19 +44,111 @@ MYSQL_DB = "vhf_opensky"
 
 CONNECTION_STRING = f"mysql://{MYSQL_USER}:{MYSQL_PASSWORD}@{MYSQL_HOST}/{MYSQL_DB}"
 
+DATABASE_URL = os.environ.get("DATABASE_URL") or CONNECTION_STRING
+# read-only sessions of the API (e.g. replica), by default the same database
+DATABASE_READ_URL = os.environ.get("DATABASE_READ_URL") or DATABASE_URL
+
+# embedded database, e.g. DATABASE_URL="sqlite:////var/lib/flight-record/flights.db"
+SQLITE_POOL_SIZE = 10
+SQLITE_TIMEOUT = 30  # seconds of waiting for the lock of the other writer
+SQLITE_PRAGMAS: dict[str, str | int] = {
+    # readers do not block the writer (and the other way around)
+    "journal_mode": "WAL",
+    # in WAL mode synchronized only on checkpoints, still consistent
+    "synchronous": "NORMAL",
+    "foreign_keys": "ON",
+    "cache_size": -64 * 1024,  # KiB
+    "mmap_size": 256 * 1024**2,
+    "temp_store": "MEMORY",
+}
+
+# flights inserted by one statement (MySQL)
+INSERT_CHUNK = 1000
+
 logger = logging.getLogger(__name__)
 
-engine = create_engine(
-    os.environ.get("DATABASE_URL") or CONNECTION_STRING,
-    echo=False,
-    pool_recycle=280,
-    pool_size=20,
-    max_overflow=30,
-)
+
+def set_sqlite_pragmas(
+    pragmas: dict[str, str | int], dbapi_connection, connection_record
+) -> None:
+    cursor = dbapi_connection.cursor()
+    for name, value in pragmas.items():
+        cursor.execute(f"PRAGMA {name} = {value}")
+    cursor.close()
+
+
+def set_mysql_read_only(dbapi_connection, connection_record) -> None:
+    cursor = dbapi_connection.cursor()
+    cursor.execute("SET SESSION TRANSACTION READ ONLY")
+    cursor.close()
+
+
+def create_database_engine(url: str, read_only: bool = False) -> Engine:
+    """Create engine, `read_only` engines have their own (smaller) pool."""
+    backend = make_url(url).get_backend_name()
+
+    if backend != "sqlite":
+        database_engine = create_engine(
+            url,
+            echo=False,
+            pool_recycle=280,
+            pool_size=10 if read_only else 20,
+            max_overflow=20 if read_only else 30,
+            # reads see the newest commits and do not hold old snapshots
+            **({"isolation_level": "READ COMMITTED"} if read_only else {}),
+        )
+        if read_only and backend == "mysql":
+            event.listen(database_engine, "connect", set_mysql_read_only)
+        return database_engine
+
+    sqlite_engine = create_engine(
+        url,
+        echo=False,
+        # pooled connections are used by all threads (API, OpenSky, writer,
+        # SpokenData), every thread waits for the lock of the current writer
+        connect_args={"check_same_thread": False, "timeout": SQLITE_TIMEOUT},
+        pool_size=SQLITE_POOL_SIZE,
+    )
+    pragmas = {**SQLITE_PRAGMAS, "query_only": "ON"} if read_only else SQLITE_PRAGMAS
+    event.listen(sqlite_engine, "connect", partial(set_sqlite_pragmas, pragmas))
+    return sqlite_engine
+
+
+engine = create_database_engine(DATABASE_URL)
+read_engine = create_database_engine(DATABASE_READ_URL, read_only=True)
 # Scoped_session = scoped_session(
 #     sessionmaker(autocommit=False, autoflush=False, bind=engine)
 # )
 Scoped_session = scoped_session(sessionmaker(bind=engine))
+Read_scoped_session = scoped_session(sessionmaker(bind=read_engine, autoflush=False))
+
+
+# loading profiles of the flights (exactly what the API serializes),
+# relationships outside of the profile raise instead of lazy loading
+FLIGHT_PROFILES: dict[str, tuple[ORMOption, ...]] = {
+    # columns of the flight
+    "info": (raiseload("*"),),
+    # track of the flight (all timestamps, if it is not compacted)
+    "track": (
+        joinedload(Flight.track),
+        selectinload(Flight.timestamps),
+        raiseload("*"),
+    ),
+    # timestamps with recordings
+    "records": (
+        load_only(Flight.id),
+        selectinload(Flight.timestamps.and_(Timestamp.mp3.isnot(None))).load_only(
+            Timestamp.mp3, Timestamp.transcript
+        ),
+        raiseload("*"),
+    ),
+    # table of the recorded flights
+    "airports": (
+        load_only(Flight.id, Flight.callsign, Flight.last_record),
+        selectinload(Flight.airports).load_only(Airport.iata_code),
+        raiseload("*"),
+    ),
+}
 
 
 def is_ready() -> bool:
@@ -54,8 +173,9 @@ def handle_error(fnc):
 
 
 class Session:
-    def __init__(self) -> None:
-        self.session = Scoped_session()
+    def __init__(self, read_only: bool = False) -> None:
+        # read-only sessions (API) do not share the pool with the writes
+        self.session = (Read_scoped_session if read_only else Scoped_session)()
 
     def insert_models(
         self, models: Iterable[Airport | Aircraft | Flight | Timestamp]
@@ -63,6 +183,40 @@ class Session:
         # add models into a query
         self.session.add_all(models)
 
+    def insert_rows(self, model: type[Base], rows: list[dict[str, Any]]) -> None:
+        # multi-row insert (executemany), skips the ORM unit of work
+        if rows:
+            self.session.execute(insert(table_of(model)), rows)
+
+    def insert_flights(self, rows: list[dict[str, Any]]) -> list[int]:
+        """Insert flights and get their generated ids (in the order of rows)."""
+        if not rows:
+            return []
+
+        table = table_of(Flight)
+        dialect = self.session.get_bind().dialect
+        if dialect.insert_executemany_returning_sort_by_parameter_order:
+            # SQLite, MariaDB
+            return list(
+                self.session.scalars(
+                    insert(table).returning(table.c.id, sort_by_parameter_order=True),
+                    rows,
+                )
+            )
+
+        # MySQL: rows of one multi-row insert get consecutive ids (InnoDB
+        # allocates them at once), the first one is the last insert id
+        increment = self.session.execute(
+            text("SELECT @@auto_increment_increment")
+        ).scalar_one()
+        ids: list[int] = []
+        for start in range(0, len(rows), INSERT_CHUNK):
+            chunk = rows[start : start + INSERT_CHUNK]
+            result = self.session.execute(insert(table).values(chunk))
+            first = cast(CursorResult, result).lastrowid
+            ids.extend(range(first, first + len(chunk) * increment, increment))
+        return ids
+
     @handle_error
     def get_aircrafts(self) -> list[Aircraft]:
         return self.session.query(Aircraft).all()
@@ -72,8 +226,19 @@ class Session:
         return self.session.query(Aircraft).filter(Aircraft.icao24 == icao24).first()
 
     @handle_error
-    def get_flight(self, id: int) -> Optional[Flight]:
-        return self.session.query(Flight).get(id)
+    def get_aircrafts_icao24(self, icao24s: Iterable[str]) -> list[str]:
+        return [
+            icao24
+            for (icao24,) in self.session.query(Aircraft.icao24).filter(
+                Aircraft.icao24.in_(icao24s)
+            )
+        ]
+
+    @handle_error
+    def get_flight(self, id: int, profile: Optional[str] = None) -> Optional[Flight]:
+        return self.session.get(
+            Flight, id, options=FLIGHT_PROFILES[profile] if profile else ()
+        )
 
     @handle_error
     def get_active_flight(self, icao24: str) -> Optional[Flight]:
@@ -88,6 +253,15 @@ class Session:
     def get_active_flights(self) -> list[Flight]:
         return self.session.query(Flight).filter(Flight.ended == False).all()
 
+    @handle_error
+    def get_active_recorded_flights_ids(self) -> list[int]:
+        return [
+            id
+            for (id,) in self.session.query(Flight.id).filter(
+                (Flight.ended == False) & (Flight.has_record == True)
+            )
+        ]
+
     @handle_error
     def get_flights_in_interval(
         self, callsigns: tuple[str, ...], start: int, end: int
@@ -101,25 +275,77 @@ class Session:
         )
 
     @handle_error
-    def get_flights_with_record_interval(
-        self, start: datetime, end: datetime
-    ) -> list[Flight]:
+    def get_flights_with_record_interval(self, start: int, end: int) -> list[Flight]:
         return (
             self.session.query(Flight)
             .filter(
                 (Flight.has_record == True)
+                # range of ix_flight_has_record_ended_last_record for both states
+                & Flight.ended.in_((False, True))
+                & (Flight.last_record >= start)
                 & (
-                    ((Flight._first_record <= start) & (Flight._last_record >= start))
-                    | ((Flight._first_record >= start) & (Flight._last_record <= end))
-                    | ((Flight._first_record <= end) & (Flight._last_record >= end))
+                    ((Flight.first_record <= start) & (Flight.last_record >= start))
+                    | ((Flight.first_record >= start) & (Flight.last_record <= end))
+                    | ((Flight.first_record <= end) & (Flight.last_record >= end))
                 )
             )
             .all()
         )
 
     @handle_error
-    def get_flight_with_records(self) -> list[Flight]:
-        return self.session.query(Flight).filter(Flight.has_record == True).all()
+    def get_flights_to_compact(self, before: int, limit: int) -> list[int]:
+        """Get ids of the ended flights with record without track."""
+        return [
+            id
+            for (id,) in self.session.query(Flight.id)
+            .filter(
+                (Flight.ended == True)
+                & (Flight.has_record == True)
+                & (Flight.last_record < before)
+                & ~Flight.track.has()
+            )
+            .limit(limit)
+        ]
+
+    @handle_error
+    def compact_track(self, flight_id: int, tolerance: float) -> int:
+        """Store timestamps of the flight as track and remove the ones without
+        recording, returns number of removed timestamps."""
+        points: list[TrackPoint] = []
+        recorded: set[int] = set()
+        for timestamp, latitude, longitude, altitude, mp3 in (
+            self.session.query(
+                Timestamp.timestamp,
+                Timestamp.latitude,
+                Timestamp.longitude,
+                Timestamp.altitude,
+                Timestamp.mp3,
+            )
+            .filter(Timestamp.flight_id == flight_id)
+            .order_by(Timestamp.timestamp)
+        ):
+            points.append(TrackPoint(timestamp, latitude, longitude, altitude))
+            if mp3:
+                recorded.add(timestamp)
+
+        points = simplify(points, tolerance, keep=frozenset(recorded))
+        self.session.add(Track(flight_id=flight_id, data=encode_track(points)))
+        result = self.session.execute(
+            delete(Timestamp).where(
+                (Timestamp.flight_id == flight_id) & Timestamp.mp3.is_(None)
+            ),
+            execution_options={"synchronize_session": False},
+        )
+        return cast(CursorResult, result).rowcount
+
+    @handle_error
+    def get_flight_with_records(self, profile: Optional[str] = None) -> list[Flight]:
+        return (
+            self.session.query(Flight)
+            .filter(Flight.has_record == True)
+            .options(*FLIGHT_PROFILES[profile] if profile else ())
+            .all()
+        )
 
     @handle_error
     def get_model(
@@ -128,10 +354,16 @@ class Session:
         return self.session.query(model).get(id)  # type: ignore[arg-type]
 
     @handle_error
-    def get_flight_from_airport(self, id: int) -> list[Flight]:
-        if airport := self.get_model(Airport, id):
-            return airport.detected_flights
-        return []
+    def get_flight_from_airport(
+        self, id: int, profile: Optional[str] = None
+    ) -> list[Flight]:
+        return (
+            self.session.query(Flight)
+            .join(Flight.airports)
+            .filter(Airport.id == id)
+            .options(*FLIGHT_PROFILES[profile] if profile else ())
+            .all()
+        )
 
     @handle_error
     def get_airports(self) -> list[Airport]:
@@ -156,33 +388,85 @@ class Session:
         return self.session.query(Airport).filter(Airport.detected_flights.any()).all()
 
     @handle_error
-    def flight_bulk_update(self, data: dict[str, Any]):
+    def flight_bulk_update(self, data: list[dict[str, Any]]):
         self.session.bulk_update_mappings(Flight, data)  # type: ignore[arg-type]
 
     @handle_error
-    def old_flights(self, date: datetime) -> list[Flight]:
-        return self.session.query(Flight).filter(Flight._last_record < date).all()
+    def get_old_flights(
+        self, old: int, no_record: int, limit: Optional[int] = None
+    ) -> list[tuple[int, bool, int]]:
+        """Get flights older than `old` and ended flights without record older
+        than `no_record` as (id, has record, last record)."""
+        return [
+            tuple(row)  # type: ignore[misc]
+            for row in self.session.query(
+                Flight.id, Flight.has_record, Flight.last_record
+            )
+            .filter(
+                (Flight.last_record < old)
+                | (
+                    (Flight.has_record == False)
+                    & Flight.ended
+                    & (Flight.last_record < no_record)
+                )
+            )
+            .limit(limit)
+        ]
 
     @handle_error
-    def ended_no_record(self, date: datetime) -> list[Flight]:
-        return (
-            self.session.query(Flight)
-            .filter(
-                (Flight.has_record == False)
-                & Flight.ended
-                & (Flight._last_record < date)
+    def get_records_files(self, ids: list[int]) -> list[tuple[str, Optional[str]]]:
+        """Get mp3 and transcript files of the flights."""
+        if not ids:
+            return []
+        return [
+            tuple(row)  # type: ignore[misc]
+            for row in self.session.query(Timestamp.mp3, Timestamp.transcript).filter(
+                Timestamp.flight_id.in_(ids) & Timestamp.mp3.isnot(None)
             )
-            .all()
-        )
+        ]
+
+    @handle_error
+    def delete_timestamps(self, flight_ids: list[int], limit: int) -> int:
+        """Delete at most `limit` timestamps of the flights, returns their count."""
+        if not flight_ids:
+            return 0
+
+        ids = [
+            id
+            for (id,) in self.session.query(Timestamp.id)
+            .filter(Timestamp.flight_id.in_(flight_ids))
+            .limit(limit)
+        ]
+        if ids:
+            self.session.execute(
+                delete(Timestamp).where(Timestamp.id.in_(ids)),
+                execution_options={"synchronize_session": False},
+            )
+        self.session.commit()
+        return len(ids)
 
     @handle_error
-    def remove_flights(self, flights: list[Flight]) -> None:
-        for flight in flights:
-            self.session.delete(flight)
+    def delete_flights(self, ids: list[int]) -> int:
+        """Set-based delete of the flights (without timestamps)."""
+        self.session.execute(
+            delete(association_table).where(association_table.c.flight_id.in_(ids))
+        )
+        self.session.execute(
+            delete(Track).where(Track.flight_id.in_(ids)),
+            execution_options={"synchronize_session": False},
+        )
+        self.session.execute(
+            delete(Flight).where(Flight.id.in_(ids)),
+            execution_options={"synchronize_session": False},
+        )
         self.session.commit()
+        return len(ids)
 
     def update_models(self) -> None:
         self.session.commit()
 
+    def rollback(self) -> None:
+        self.session.rollback()
+
     def close(self) -> None:
         self.session.close()
@@ -0,0 +1,154 @@
+"""Compact binary encoding of the flight track.
+
+Points are stored as varints of the differences to the previous point:
+time in seconds, latitude and longitude in 1e-5 degrees (about 1 m) and
+altitude in meters. Signed differences are zigzag encoded, unknown altitude
+is stored as 0.
+"""
+import math
+from typing import NamedTuple, Optional
+
+VERSION = 1
+COORDINATES_SCALE = 100_000  # 1e-5 degrees
+METERS_PER_DEGREE = 111_195
+
+
+class TrackPoint(NamedTuple):
+    timestamp: int
+    latitude: float
+    longitude: float
+    altitude: Optional[float]
+
+    @property
+    def position(self) -> tuple[float, float]:
+        return self.latitude, self.longitude
+
+
+def write_varint(output: bytearray, value: int) -> None:
+    while value >= 0x80:
+        output.append((value & 0x7F) | 0x80)
+        value >>= 7
+    output.append(value)
+
+
+def read_varint(data: bytes, index: int) -> tuple[int, int]:
+    """Get value and index of the next varint."""
+    value = shift = 0
+    while True:
+        byte = data[index]
+        index += 1
+        value |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return value, index
+        shift += 7
+
+
+def zigzag(value: int) -> int:
+    return value << 1 if value >= 0 else (-value << 1) - 1
+
+
+def unzigzag(value: int) -> int:
+    return value >> 1 if not value & 1 else -((value + 1) >> 1)
+
+
+def distance(point: TrackPoint, start: TrackPoint, end: TrackPoint) -> float:
+    """Distance of the point from the segment in meters (locally flat earth)."""
+    scale = math.cos(math.radians(start.latitude))
+    x, y = (point.longitude - start.longitude) * scale, point.latitude - start.latitude
+    dx, dy = (end.longitude - start.longitude) * scale, end.latitude - start.latitude
+
+    if length := dx * dx + dy * dy:
+        t = max(0.0, min(1.0, (x * dx + y * dy) / length))
+        x, y = x - t * dx, y - t * dy
+
+    return math.hypot(x, y) * METERS_PER_DEGREE
+
+
+def simplify(
+    points: list[TrackPoint], tolerance: float, keep: frozenset[int] = frozenset()
+) -> list[TrackPoint]:
+    """Remove points closer than `tolerance` meters to the simplified track
+    (Ramer-Douglas-Peucker), timestamps in `keep` are never removed."""
+    if tolerance <= 0 or len(points) < 3:
+        return points
+
+    kept = [False] * len(points)
+    kept[0] = kept[-1] = True
+    for i, point in enumerate(points):
+        if point.timestamp in keep:
+            kept[i] = True
+
+    stack = [(0, len(points) - 1)]
+    while stack:
+        start, end = stack.pop()
+        if end - start < 2:
+            continue
+
+        index, maximal = start, 0.0
+        for i in range(start + 1, end):
+            if (d := distance(points[i], points[start], points[end])) > maximal:
+                index, maximal = i, d
+
+        if maximal > tolerance:
+            kept[index] = True
+            stack.append((start, index))
+            stack.append((index, end))
+
+    return [point for point, keep_point in zip(points, kept) if keep_point]
+
+
+def encode_track(points: list[TrackPoint]) -> bytes:
+    """Encode points ordered by time."""
+    output = bytearray([VERSION])
+    write_varint(output, len(points))
+
+    time = latitude = longitude = altitude = 0
+    for point in points:
+        new_latitude = round(point.latitude * COORDINATES_SCALE)
+        new_longitude = round(point.longitude * COORDINATES_SCALE)
+
+        write_varint(output, point.timestamp - time)
+        write_varint(output, zigzag(new_latitude - latitude))
+        write_varint(output, zigzag(new_longitude - longitude))
+
+        if point.altitude is None:
+            write_varint(output, 0)
+        else:
+            new_altitude = round(point.altitude)
+            write_varint(output, zigzag(new_altitude - altitude) + 1)
+            altitude = new_altitude
+
+        time, latitude, longitude = point.timestamp, new_latitude, new_longitude
+
+    return bytes(output)
+
+
+def decode_track(data: bytes) -> list[TrackPoint]:
+    if data[0] != VERSION:
+        raise ValueError(f"Unknown version of the track: {data[0]}")
+
+    count, index = read_varint(data, 1)
+    points: list[TrackPoint] = []
+
+    time = latitude = longitude = altitude = 0
+    for _ in range(count):
+        delta, index = read_varint(data, index)
+        time += delta
+        delta, index = read_varint(data, index)
+        latitude += unzigzag(delta)
+        delta, index = read_varint(data, index)
+        longitude += unzigzag(delta)
+        delta, index = read_varint(data, index)
+        if delta:
+            altitude += unzigzag(delta - 1)
+
+        points.append(
+            TrackPoint(
+                time,
+                latitude / COORDINATES_SCALE,
+                longitude / COORDINATES_SCALE,
+                float(altitude) if delta else None,
+            )
+        )
+
+    return points
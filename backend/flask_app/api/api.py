@@ -1,15 +1,20 @@
 import json
+import math
 from datetime import datetime
-from typing import Any
+from typing import Any, Optional, Sequence
 
 import pytz
+from clustering import Cluster
+from clustering.grid import cell_size
+from clustering.tiles import BoundingBox, pad
 from database.models import Flight, Timestamp
 from database.session import Session
+from database.track import TrackPoint, decode_track
 from flask import Blueprint, Response, jsonify, request
 from flask_app import PATH_TO_APP, flights, get_api_url
 from haversine import haversine
 from profiling_decorators import time_profile
-from threads import ZOOM_LEVELS, lock_flights
+from threads import ZOOM_LEVELS, flight_tiles, lock_flights
 
 MAX_SPEED = 950
 OVERLAP = 3000
@@ -36,6 +41,26 @@ def check_requets(*args: str) -> bool:
     return True
 
 
+def parse_id(value: str) -> Optional[int]:
+    try:
+        return int(value)
+    except ValueError:
+        return None
+
+
+def parse_bbox(value: str) -> Optional[BoundingBox]:
+    """Get bounding box from "west,south,east,north" (degrees)."""
+    try:
+        west, south, east, north = (float(i) for i in value.split(","))
+    except ValueError:
+        return None
+    if not all(math.isfinite(i) for i in (west, south, east, north)):
+        return None
+    if south > north:
+        return None
+    return west, south, east, north
+
+
 def get_flight_info(*flights: Flight) -> list[dict[str, Any]]:
     """Get JSON like representation of flights models."""
     output = []
@@ -76,8 +101,11 @@ def get_airport():
     if not check_requets("id"):
         return jsonify({"flights": []}), 200
 
-    session = Session()
-    flights = session.get_flight_from_airport(request.args["id"])
+    if (id := parse_id(request.args["id"])) is None:
+        return return_error()
+
+    session = Session(read_only=True)
+    flights = session.get_flight_from_airport(id, profile="info")
     session.close()
 
     return (
@@ -103,7 +131,7 @@ def get_airport():
 @api.route("/airports")
 def get_airports() -> tuple[Response, int]:
     """Get airports with recordings."""
-    session = Session()
+    session = Session(read_only=True)
     airports = session.get_active_airports()
     session.close()
 
@@ -134,8 +162,11 @@ def get_flight() -> tuple[Response, int]:
     if not check_requets("id"):
         return return_error()
 
-    session = Session()
-    flight = session.get_flight(int(request.args["id"]))
+    if (id := parse_id(request.args["id"])) is None:
+        return return_error()
+
+    session = Session(read_only=True)
+    flight = session.get_flight(id, profile="info")
     session.close()
     if flight:
         return (
@@ -148,7 +179,7 @@ def get_flight() -> tuple[Response, int]:
 @api.route("/flights", methods=["GET"])
 @lock_flights
 def get_flights() -> tuple[Response, int]:
-    """Get clustered flights."""
+    """Get clustered flights (optionally only within `bbox`)."""
     if not check_requets("zoom"):
         return return_error()
 
@@ -158,7 +189,22 @@ def get_flights() -> tuple[Response, int]:
         zoom = -1
     elif zoom < min(ZOOM_LEVELS):
         zoom = min(ZOOM_LEVELS)
-    return jsonify({"clusters": [cluster.json() for cluster in flights[zoom]]}), 200
+
+    if "bbox" not in request.args:
+        return jsonify({"clusters": [cluster.json() for cluster in flights[zoom]]}), 200
+
+    # only clusters (flights) visible in the viewport
+    if (bbox := parse_bbox(request.args["bbox"])) is None:
+        return return_error()
+
+    if zoom != -1:
+        # clusters are indexed by their centroids, members of the clusters
+        # at the edge of the viewport are up to a cell of the zoom away
+        bbox = pad(bbox, math.degrees(cell_size(zoom)))
+    visible = flight_tiles[zoom].query(bbox)
+    if zoom == -1:
+        visible = [Cluster(cluster=-1, position=None, data=visible)]
+    return jsonify({"clusters": [cluster.json() for cluster in visible]}), 200
 
 
 # TODO: move to other file
@@ -193,7 +239,7 @@ def parse_transcript(transcript_path: str) -> Any:
     return output
 
 
-def get_lines(timestamps: list[Timestamp]) -> list[dict[str, Any]]:
+def get_lines(timestamps: Sequence[Timestamp | TrackPoint]) -> list[dict[str, Any]]:
     """Get lines with specific attribute."""
     # calculate positions with distance between every 2 points
     positions = [
@@ -231,8 +277,11 @@ def get_flight_timestamps() -> tuple[Response, int]:
     if not check_requets("id"):
         return return_error()
 
-    session = Session()
-    flight = session.get_flight(int(request.args["id"]))
+    if (id := parse_id(request.args["id"])) is None:
+        return return_error()
+
+    session = Session(read_only=True)
+    flight = session.get_flight(id, profile="track")
 
     if not flight:
         session.close()
@@ -248,7 +297,10 @@ def get_flight_timestamps() -> tuple[Response, int]:
         for timestamp in flight.timestamps
         if timestamp.mp3
     ]
-    lines = get_lines(flight.timestamps)
+    # track of the compacted flight (timestamps contain only recordings)
+    lines = get_lines(
+        decode_track(flight.track.data) if flight.track else flight.timestamps
+    )
     session.close()
 
     return jsonify({"lines": lines, "markers": markers}), 200
@@ -258,8 +310,8 @@ def get_flight_timestamps() -> tuple[Response, int]:
 @time_profile
 def get_flights_with_record() -> tuple[Response, int]:
     """Get all flights with recordigns."""
-    session = Session()
-    db_flights = session.get_flight_with_records()
+    session = Session(read_only=True)
+    db_flights = session.get_flight_with_records(profile="airports")
     output = [
         {
             "id": flight.id,
@@ -283,9 +335,14 @@ def get_flight_records() -> tuple[Response, int]:
     if not check_requets("id"):
         return return_error()
 
-    session = Session()
+    if (id := parse_id(request.args["id"])) is None:
+        return return_error()
 
-    db_flight = session.get_flight(request.args["id"])
+    session = Session(read_only=True)
+    db_flight = session.get_flight(id, profile="records")
+    if not db_flight:
+        session.close()
+        return return_error()
 
     output = [
         {
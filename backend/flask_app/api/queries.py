@@ -0,0 +1,135 @@
+"""Check of the number of queries issued by the API endpoints.
+
+Seeds a temporary SQLite database with a few flights (recordings, airports
+and a compacted track), calls every endpoint reading the database and fails
+when it issues more queries than its budget (or the response is not OK,
+e.g. a relationship outside of the loading profile was accessed).
+
+Run from the backend directory: python -m flask_app.api.queries
+"""
+import os
+import sys
+import tempfile
+import time
+
+DIRECTORY = tempfile.TemporaryDirectory()
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(DIRECTORY.name, 'api.db')}"
+os.environ.pop("DATABASE_READ_URL", None)
+
+from database import upgrade_schema  # noqa: E402
+from database.models import (  # noqa: E402
+    Aircraft,
+    Airport,
+    Flight,
+    Timestamp,
+    Track,
+)
+from database.session import Scoped_session, read_engine  # noqa: E402
+from database.track import TrackPoint, encode_track  # noqa: E402
+from flask_app import create_app  # noqa: E402
+from sqlalchemy import event  # noqa: E402
+
+FLIGHTS = 20
+TIMESTAMPS = 50
+AIRPORTS = 3
+
+# endpoint: queries (independent of the number of flights and timestamps)
+BUDGETS: dict[str, int] = {
+    "/api/airport/flights?id=1": 1,
+    "/api/airports": 1,
+    "/api/flight?id=1": 1,
+    "/api/flight/timestamps?id=1": 2,  # compacted flight
+    "/api/flight/timestamps?id=2": 2,
+    "/api/flights/record/all": 2,
+    "/api/flight/records?id=2": 2,
+}
+
+
+def seed() -> None:
+    """Create flights with recordings, the first flight is compacted."""
+    session = Scoped_session()
+    now = int(time.time())
+
+    airports = [
+        Airport(
+            id=id,
+            iata_code=f"AP{id}",
+            type="large_airport",
+            name=f"Airport {id}",
+            latitude=50.0 + id,
+            longitude=14.0 + id,
+        )
+        for id in range(1, AIRPORTS + 1)
+    ]
+    session.add_all(airports)
+    session.add(Aircraft(icao24="4b1805", origin_country="Czech Republic"))
+
+    for id in range(1, FLIGHTS + 1):
+        points = [
+            TrackPoint(now + i * 15, 50.0 + i * 0.01, 14.0 + i * 0.01, 3000.0)
+            for i in range(TIMESTAMPS)
+        ]
+        flight = Flight(
+            id=id,
+            aircraft_icao24="4b1805",
+            callsign=f"CSA{id:<5}",
+            first_record=points[0].timestamp,
+            last_record=points[-1].timestamp,
+            ended=id == 1,
+            has_record=True,
+            latitude=points[-1].latitude,
+            longitude=points[-1].longitude,
+            track_angle=45.0,
+            airports=airports,
+        )
+        flight.timestamps = [
+            Timestamp(
+                timestamp=point.timestamp,
+                latitude=point.latitude,
+                longitude=point.longitude,
+                altitude=point.altitude,
+                mp3=f"static/data/mp3/{id}_{i}.mp3" if i % 10 == 0 else None,
+            )
+            for i, point in enumerate(points)
+            if id != 1 or i % 10 == 0
+        ]
+        if id == 1:
+            flight.track = Track(data=encode_track(points))
+        session.add(flight)
+
+    session.commit()
+    Scoped_session.remove()
+
+
+def main() -> int:
+    upgrade_schema()
+    seed()
+    client = create_app().test_client()
+
+    statements: list[str] = []
+
+    def before_execute(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(read_engine, "before_cursor_execute", before_execute)
+
+    failed = False
+    for url, budget in BUDGETS.items():
+        statements.clear()
+        response = client.get(url)
+        ok = response.status_code == 200 and len(statements) <= budget
+        failed |= not ok
+        print(
+            f"{'OK' if ok else 'FAILED':<10} {url:<32} "
+            f"{len(statements)}/{budget} queries ({response.status_code})"
+        )
+        if not ok:
+            for statement in statements:
+                print(f"    {' '.join(statement.split())}")
+
+    event.remove(read_engine, "before_cursor_execute", before_execute)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,6 +1,10 @@
 from ctypes import CDLL, c_double
 from pathlib import Path
 
+import numpy as np
+
+RADIUS = 6371  # Radius of the Earth in kilometers
+
 path = Path("haversine/distance.so")
 
 c_haversine = CDLL(str(path.absolute()))
@@ -11,3 +15,15 @@ def haversine(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
     return c_haversine.haversine(
         c_double(lat1), c_double(lon1), c_double(lat2), c_double(lon2)
     )
+
+
+def haversine_np(
+    lat1: np.ndarray, lon1: np.ndarray, lat2: np.ndarray, lon2: np.ndarray
+) -> np.ndarray:
+    """Vectorized version of `haversine` for NumPy arrays (in kilometers)."""
+    lat1, lon1, lat2, lon2 = map(np.radians, (lat1, lon1, lat2, lon2))
+    a = (
+        np.sin((lat2 - lat1) / 2) ** 2
+        + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    )
+    return 2 * RADIUS * np.arctan2(np.sqrt(a), np.sqrt(1 - a))
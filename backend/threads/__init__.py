@@ -1,9 +1,10 @@
 import logging
 from functools import wraps
 from threading import Lock
-from typing import Any, Callable, Optional
+from typing import Any, Callable
 
-from clustering import ZOOM_LEVELS, Cluster
+import numpy as np
+from clustering import ZOOM_LEVELS, Cluster, TileIndex, tile_indexes
 
 logging.basicConfig(
     level=logging.ERROR,
@@ -14,6 +15,8 @@ logging.basicConfig(
 lock = Lock()
 
 flights: dict[int, list[Cluster]] = {i: [] for i in ZOOM_LEVELS} | {-1: []}  # type: ignore[assignment]
+# the same clusters indexed by the map tiles (viewport queries)
+flight_tiles: dict[int, TileIndex[Any]] = tile_indexes(flights)
 
 
 def lock_flights(func: Callable[..., Any]) -> Callable[..., Any]:
@@ -27,7 +30,9 @@ def lock_flights(func: Callable[..., Any]) -> Callable[..., Any]:
     return decorator
 
 
-def to_valid_callsign(callsign: Optional[str]) -> str:
-    if callsign is not None and len(callsign.strip()) >= 6:
-        return callsign.ljust(8)
-    return ""
+def to_valid_callsigns(callsigns: np.ndarray) -> np.ndarray:
+    """Pad valid callsigns to 8 characters, invalid are replaced by empty string."""
+    if not len(callsigns):
+        return callsigns
+    valid = np.char.str_len(np.char.strip(callsigns)) >= 6
+    return np.where(valid, np.char.ljust(callsigns, 8), "")
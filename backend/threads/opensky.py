@@ -1,16 +1,21 @@
 import logging
-import time
-from datetime import datetime
+from collections import OrderedDict
+from heapq import heappop, heappush
 from threading import Thread
-from typing import Any, Optional
-
-from api.opensky import OpenSkyApi
-from clustering import get_clusters
-from database.models import Aircraft, Flight, LastContactInfo, Timestamp
+from typing import Any, Iterable, Optional
+
+import numpy as np
+from api.client import client
+from api.opensky import OpenSkyApi, StateVectors
+from api.replay import OpenSkyReplayApi, replay_from_env
+from clustering import get_clusters, tile_indexes
+from database.models import Flight, LastContactInfo
 from database.session import Session
-from haversine import haversine
+from haversine import haversine_np
 from profiling_decorators import log_duration, time_profile, time_profile_sum
-from threads import flights, lock, to_valid_callsign
+from threads import flight_tiles, flights, lock, to_valid_callsigns
+from threads.poller import Poller
+from threads.writer import FLUSH_TIMEOUT, DatabaseWriter, WriteBatch
 
 logger = logging.getLogger(__name__)
 
@@ -20,82 +25,326 @@ MAXIMAL_INACTIVE = 5 * 3600  # 5h
 MINIMAL_VELOCITY = 100
 MINIMAL_VERTICAL_RATE = 0
 MAXIMAL_AIRPLANE_SPEED = 950  # km/h
+AIRCRAFT_CACHE_SIZE = 50_000
+PENDING_SIZE = 200_000  # changes kept while the writer queue is full
 
 
-def time_diff(timestamp: int) -> int:
-    return int(datetime.now().strftime("%s")) - timestamp
+def time_diff(timestamp: int, now: int) -> int:
+    return now - timestamp
 
 
-def is_valid_timestamp(prev_time: int, time_now: int, distance: float) -> bool:
-    speed = distance / (abs(time_now - prev_time) / 3600)
-    if speed > MAXIMAL_AIRPLANE_SPEED:
-        if distance >= 3000:
-            return True
-        return False
+def valid_timestamps(
+    prev_times: np.ndarray, times_now: np.ndarray, distances: np.ndarray
+) -> np.ndarray:
+    """Check that the speed between two positions is possible for an airplane."""
+    with np.errstate(divide="ignore", invalid="ignore"):
+        speed = distances / (np.abs(times_now - prev_times) / 3600)
+    return (speed <= MAXIMAL_AIRPLANE_SPEED) | (distances >= 3000)
+
+
+def valid_state_vectors(state_vectors: StateVectors) -> StateVectors:
+    """Keep only state vectors with valid callsign, position and time."""
+    state_vectors.callsign = to_valid_callsigns(state_vectors.callsign)
+    return state_vectors.filter(
+        (state_vectors.callsign != "")
+        & np.isfinite(state_vectors.latitude)
+        & np.isfinite(state_vectors.longitude)
+        & (state_vectors.time_position != 0)
+    )
+
 
-    return True
+def to_optional_list(column: np.ndarray) -> list[Optional[float]]:
+    """Convert float column to list where `nan` is replaced by None."""
+    values = column.astype(object)
+    values[np.isnan(column)] = None
+    return values.tolist()
 
 
 class FlightProps:
-    def __init__(self, flight: Flight, active: bool) -> None:
-        self.flight = flight
-        self.active = active
+    """In-memory state of the tracked flight.
+
+    The state is kept across ticks, so the database only receives inserts
+    and updates of the changed flights.
+    """
+
+    def __init__(
+        self,
+        icao24: str,
+        callsign: str,
+        first_record: int,
+        last_record: int,
+        info: Optional[LastContactInfo] = None,
+        id: Optional[int] = None,
+    ) -> None:
+        # id of the new flight is set by the DatabaseWriter thread after the
+        # insert is committed, the OpenSky thread only reads it (a single
+        # attribute assignment is atomic), None means the flight is not in the
+        # database (yet, or its batch was dropped)
+        self.id = id
+        self.icao24 = icao24
+        self.callsign = callsign
+        self.first_record = first_record
+        self.last_record = last_record
+        self.info = info
+        self.ended = False
+
+    @classmethod
+    def from_model(cls, flight: Flight) -> "FlightProps":
+        return cls(
+            flight.aircraft_icao24,
+            flight.callsign,
+            flight.first_record,
+            flight.last_record,
+            info=flight.last_contact_info,
+            id=flight.id,
+        )
+
+    def to_row(self) -> dict[str, Any]:
+        """Get values for the insert of the flight."""
+        return {
+            "aircraft_icao24": self.icao24,
+            "callsign": self.callsign,
+            "first_record": self.first_record,
+            "last_record": self.last_record,
+            "ended": self.ended,
+            **self.info.to_dict(),  # type: ignore[union-attr]
+        }
+
+    def to_mapping(self) -> dict[str, Any]:
+        """Get values for the bulk update of the flight (without id)."""
+        return {
+            "last_record": self.last_record,
+            "ended": self.ended,
+            **self.info.to_dict(),  # type: ignore[union-attr]
+        }
 
 
 class Flights:
     def __init__(self, flights: Optional[list[Flight]]) -> None:
         self.flights: dict[str, FlightProps] = {}
+        # flights updated in the current iteration
+        self.active: set[str] = set()
         if flights:
             self.flights = {
-                flight.aircraft_icao24: FlightProps(flight, False) for flight in flights
+                flight.aircraft_icao24: FlightProps.from_model(flight)
+                for flight in flights
             }
 
     def exists(self, icao24: str) -> bool:
         """Check flight existence."""
         return icao24 in self.flights.keys()
 
-    def add_flight(self, flight: Flight) -> None:
+    def add_flight(self, flight: FlightProps) -> None:
         """Add new flight."""
-        self.flights[flight.aircraft_icao24] = FlightProps(flight, False)
+        self.flights[flight.icao24] = flight
 
-    def get_flight(self, icao24: str) -> Optional[Flight]:
+    def get_flight(self, icao24: str) -> Optional[FlightProps]:
         """Get flight."""
-        if self.exists(icao24):
-            return self.flights[icao24].flight
+        return self.flights.get(icao24)
 
-        return None
+    def remove_flight(self, icao24: str) -> None:
+        """Stop tracking flight."""
+        self.flights.pop(icao24, None)
+        self.active.discard(icao24)
 
     def set_active(self, icao24: str, value: bool) -> None:
         """Set flight active state."""
-        if self.exists(icao24):
-            self.flights[icao24].active = value
+        if value and self.exists(icao24):
+            self.active.add(icao24)
+        else:
+            self.active.discard(icao24)
+
+    def reset_active(self) -> None:
+        """Set all flights as inactive."""
+        self.active.clear()
+
+
+class AircraftCache:
+    """Bounded LRU cache of aircrafts that are stored in the database."""
+
+    def __init__(self, size: int = AIRCRAFT_CACHE_SIZE) -> None:
+        self.size = size
+        self.aircrafts: OrderedDict[str, None] = OrderedDict()
+
+    def __contains__(self, icao24: str) -> bool:
+        if icao24 in self.aircrafts:
+            self.aircrafts.move_to_end(icao24)
+            return True
+        return False
+
+    def update(self, icao24s: Iterable[str]) -> None:
+        """Add aircrafts, least recently used are evicted."""
+        for icao24 in icao24s:
+            self.aircrafts[icao24] = None
+            self.aircrafts.move_to_end(icao24)
+
+        while len(self.aircrafts) > self.size:
+            self.aircrafts.popitem(last=False)
+
+    def clear(self) -> None:
+        self.aircrafts.clear()
+
+
+class FlightDeadlines:
+    """Min-heap of times after which the flights can be ended.
+
+    Every flight has one scheduled deadline. It can be earlier than the real
+    one (the flight was updated since), in that case it is moved once it is
+    reached. Each iteration touches only flights with reached deadlines.
+    """
+
+    def __init__(self) -> None:
+        self.heap: list[tuple[int, str]] = []
+        self.scheduled: dict[str, int] = {}
+
+    def schedule(self, icao24: str, deadline: int, force: bool = False) -> None:
+        """Schedule deadline, unless there is an earlier one already."""
+        if not force and self.scheduled.get(icao24, deadline + 1) <= deadline:
+            return
+
+        self.scheduled[icao24] = deadline
+        heappush(self.heap, (deadline, icao24))
+
+    def remove(self, icao24: str) -> None:
+        self.scheduled.pop(icao24, None)
+
+    def expired(self, now: int) -> list[str]:
+        """Remove and get flights with deadline before `now`."""
+        expired = []
+        while self.heap and self.heap[0][0] < now:
+            deadline, icao24 = heappop(self.heap)
+            # skip deadlines replaced by earlier ones
+            if self.scheduled.get(icao24) == deadline:
+                del self.scheduled[icao24]
+                expired.append(icao24)
+        return expired
 
 
 class OpenSkyThread(Thread):
     def __init__(self) -> None:
         Thread.__init__(self)
-        self.api = OpenSkyApi()
+        # recorded responses are used instead of the live API when configured
+        self.api: OpenSkyApi | OpenSkyReplayApi = replay_from_env() or OpenSkyApi()
+        # next state vectors are fetched while the current ones are processed
+        self.poller: Poller[StateVectors] = Poller(
+            lambda: self.api.get_all_state_vectors(columnar=True),
+            self.api.poll_interval,
+            retry_after=lambda: self.api.retry_after,
+            name="OpenSkyPoller",
+        )
 
         # flights considered as possibly ended
         self.possibly_ended_flights: set[str] = set()
+        # when flights should be checked for the ending
+        self.deadlines = FlightDeadlines()
 
-        # models to upload to database after every iteration
-        self.add_aircrafts: list[Aircraft] = []
-        self.add_flights: list[Flight] = []
-        self.add_timestamps: list[Timestamp] = []
+        # rows handed off to the database writer after every iteration
+        self.add_aircrafts: list[dict[str, Any]] = []
+        self.add_flights: list[FlightProps] = []
+        self.add_timestamps: list[tuple[FlightProps, dict[str, Any]]] = []
+        self.changed_flights: set[FlightProps] = set()
 
-        self.__flights: Flights  # flight management
+        self.writer = DatabaseWriter()
+        # changes that did not fit into the writer queue
+        self.pending: Optional[WriteBatch] = None
+
+        # aircrafts known to be in the database
+        self.aircrafts = AircraftCache()
+        # aircrafts of the current iteration that are not in the database yet
+        self.new_aircrafts: set[str] = set()
+
+        self.__flights: Optional[Flights] = None  # flight management
         self.__session: Session  # db session
 
+    @property
+    def tracked_flights(self) -> Flights:
+        """Tracked flights, loaded by `load_flights` after every reset."""
+        if self.__flights is None:
+            raise RuntimeError("Flights are not loaded!")
+        return self.__flights
+
+    def load_flights(self) -> None:
+        """Load active flights from the database, done only once at startup."""
+        # database has to contain all changes
+        if self.pending is not None:
+            if not self.writer.submit(self.pending, block=True, timeout=FLUSH_TIMEOUT):
+                raise RuntimeError("Database writer is stuck, unable to load flights!")
+            self.pending = None
+        if not self.writer.flush():
+            raise RuntimeError("Database writer is stuck, unable to load flights!")
+        self.writer.reload.clear()
+
+        active_flights = self.__session.get_active_flights()
+        if active_flights is None:
+            raise RuntimeError("Unable to load active flights!")
+
+        self.__flights = Flights(active_flights)
+        for flight in self.__flights.flights.values():
+            self.deadlines.schedule(flight.icao24, self.flight_deadline(flight))
+
+    def reset(self) -> None:
+        """Drop pending changes, flights will be loaded again from the database."""
+        self.add_aircrafts = []
+        self.add_flights = []
+        self.add_timestamps = []
+        self.changed_flights = set()
+        self.aircrafts.clear()
+        self.deadlines = FlightDeadlines()
+        self.__flights = None
+
+    def resolve_aircrafts(self, icao24s: Iterable[str]) -> None:
+        """Find aircrafts missing in the database using at most one query."""
+        unknown = {icao24 for icao24 in icao24s if icao24 not in self.aircrafts}
+        if not unknown:
+            self.new_aircrafts = set()
+            return
+
+        existing = self.__session.get_aircrafts_icao24(unknown)
+        if existing is None:
+            raise RuntimeError("Unable to load aircrafts!")
+
+        self.aircrafts.update(existing)
+        self.new_aircrafts = unknown - set(existing)
+
     @time_profile
     def update_flights_db_state(self) -> None:
-        self.__session.insert_models(self.add_aircrafts)
-        self.__session.insert_models(self.add_flights)
-        self.__session.insert_models(self.add_timestamps)
-        self.__session.update_models()
+        batch = WriteBatch(
+            aircrafts=self.add_aircrafts,
+            flights=[(props, props.to_row()) for props in self.add_flights],
+            updates={props: props.to_mapping() for props in self.changed_flights},
+            timestamps=self.add_timestamps,
+        )
         self.add_aircrafts = []
         self.add_timestamps = []
         self.add_flights = []
+        self.changed_flights = set()
+
+        # hand off changes to the writer, keep them if it is busy
+        if self.pending is not None:
+            batch = self.pending.merge(batch)
+        if self.writer.submit(batch):
+            self.pending = None
+        else:
+            print("Writer queue is full, changes postponed:", len(batch))
+            if len(batch) > PENDING_SIZE:
+                print(
+                    "Postponed changes are full, timestamps dropped:", batch.collapse()
+                )
+            self.pending = batch
+
+    def end_flight(self, flight: FlightProps) -> None:
+        """End flight and stop tracking it."""
+        flight.ended = True
+        self.changed_flights.add(flight)
+        self.tracked_flights.remove_flight(flight.icao24)
+        self.deadlines.remove(flight.icao24)
+        self.remove_from_possibly_ended(flight.icao24)
+
+    def flight_deadline(self, flight: FlightProps) -> int:
+        """Time after which the flight is ended without new update."""
+        if flight.icao24 in self.possibly_ended_flights:
+            return flight.last_record + P_END_INACTIVE_MAX
+        return flight.last_record + MAXIMAL_INACTIVE
 
     @time_profile_sum
     def create_flight_check(
@@ -104,91 +353,120 @@ class OpenSkyThread(Thread):
         callsign: str,
         timestamp: int,
         **options: Any,
-    ) -> Flight:
-        # create new flight
-        flight = Flight(
-            aircraft_icao24=icao24,
-            callsign=callsign,
-            first_record=timestamp,
-            last_record=timestamp,
-        )
-
-        if prev_flight := self.__flights.get_flight(icao24):
+    ) -> FlightProps:
+        if prev_flight := self.tracked_flights.get_flight(icao24):
             # check if callsign is the same
-            if not (prev_flight.callsign == callsign):
-                # end previous flight
-                prev_flight.end()
-                self.remove_from_possibly_ended(prev_flight.aircraft_icao24)
-                self.add_flights.append(flight)
-            else:  # just return already existing flight
+            if prev_flight.callsign == callsign:
+                # just return already existing flight
                 return prev_flight
-        else:  # aircraft not detected in the current flights
-            # get from database
-            aircraft = self.__session.get_aircraft(icao24)
+
+            # end previous flight
+            self.end_flight(prev_flight)
+        # aircraft not detected in the current flights nor in the database
+        elif icao24 in self.new_aircrafts:
             # new aircraft
-            if not aircraft:
-                aircraft = Aircraft(icao24=icao24, **options)
-                self.add_aircrafts.append(aircraft)
+            self.add_aircrafts.append({"icao24": icao24, **options})
+            self.new_aircrafts.discard(icao24)
+            self.aircrafts.update([icao24])
 
-            # add flight to the current tracking flights
-            self.__flights.add_flight(flight)
-            self.add_flights.append(flight)
+        # create new flight and add it to the current tracking flights
+        flight = FlightProps(icao24, callsign, timestamp, timestamp)
+        self.tracked_flights.add_flight(flight)
+        self.deadlines.schedule(icao24, self.flight_deadline(flight))
+        self.add_flights.append(flight)
 
         return flight
 
     @time_profile_sum
     def last_contact_check(
-        self, flight: Flight, info: LastContactInfo, timestamp: Timestamp
+        self, flights: list[FlightProps], vectors: StateVectors
     ) -> None:
         MIN_TRAVELLED_DISTANCE = 25 * 0.001  # (from meters) km
 
-        # new flight
-        if flight.id is None:
-            flight.add_timestamp(timestamp)
-            flight.update_last_contact(info)
+        # new flights have no previous contact
+        new = np.array([flight.info is None for flight in flights], dtype=bool)
 
         # get previous timestamp values
-        prev_lat, prev_long = (
-            flight.last_contact_info.latitude,
-            flight.last_contact_info.longitude,
+        previous = np.array(
+            [
+                (flight.info.latitude, flight.info.longitude, flight.last_record)
+                if flight.info is not None
+                else (np.nan, np.nan, np.nan)
+                for flight in flights
+            ],
+            dtype=np.float64,
+        ).reshape(-1, 3)
+        prev_lat, prev_long, prev_time = previous.T
+
+        distances = haversine_np(
+            prev_lat, prev_long, vectors.latitude, vectors.longitude
         )
 
         # if new timestamp is higher than previous one
         # and airplane has travelled more than 25m
-        if (
-            (flight.last_record < timestamp.timestamp)
-            and (
-                (
-                    distance := haversine(
-                        prev_lat, prev_long, timestamp.latitude, timestamp.longitude
-                    )
-                )
-                > MIN_TRAVELLED_DISTANCE
+        accepted = (
+            (prev_time < vectors.time_position)
+            & (distances > MIN_TRAVELLED_DISTANCE)
+            & valid_timestamps(prev_time, vectors.time_position, distances)
+        )
+
+        # create rows only for accepted updates and new flights
+        indices = np.flatnonzero(accepted | new)
+        times = vectors.time_position[indices].tolist()
+        latitudes = vectors.latitude[indices].tolist()
+        longitudes = vectors.longitude[indices].tolist()
+        track_angles = np.nan_to_num(vectors.true_track[indices]).tolist()
+        vertical_rates = to_optional_list(vectors.vertical_rate[indices])
+        velocities = to_optional_list(vectors.velocity[indices])
+        altitudes = to_optional_list(vectors.geo_altitude[indices])
+
+        for i, index in enumerate(indices.tolist()):
+            flight = flights[index]
+            flight.info = LastContactInfo(
+                latitude=latitudes[i],
+                longitude=longitudes[i],
+                track_angle=track_angles[i],
+                vertical_rate=vertical_rates[i],
+                velocity=velocities[i],
+                altitude=altitudes[i],
             )
-            and is_valid_timestamp(flight.last_record, timestamp.timestamp, distance)
-        ):
-            # update flight model
-            flight.update_last_contact(info)
-            self.add_timestamps.append(timestamp)
-            flight.last_record = timestamp.timestamp
+            timestamp = {
+                "timestamp": times[i],
+                "latitude": latitudes[i],
+                "longitude": longitudes[i],
+                "altitude": altitudes[i],
+            }
+            self.add_timestamps.append((flight, timestamp))
+
+            # new flight
+            if new[index]:
+                continue
+
+            # update flight
+            flight.last_record = times[i]
+            self.changed_flights.add(flight)
             # set flight to active
-            self.__flights.set_active(flight.aircraft_icao24, True)
+            self.tracked_flights.set_active(flight.icao24, True)
 
     @time_profile_sum
-    def possible_ending_check(
-        self, flight: Flight, velocity: None | float, vertical_rate: None | float
-    ) -> None:
+    def possible_ending_check(self, vectors: StateVectors) -> None:
         # checks if flight is possibly ending
         # it is not accurate.. since both values can be None
         # TODO: think of something better
-        if (
-            (velocity is None or velocity < MINIMAL_VELOCITY)
-            and (vertical_rate is None or vertical_rate < MINIMAL_VERTICAL_RATE)
-            and (flight not in self.possibly_ended_flights)
-        ):
-            self.possibly_ended_flights.add(flight.aircraft_icao24)
-        else:
-            self.remove_from_possibly_ended(flight.aircraft_icao24)
+        velocity, vertical_rate = vectors.velocity, vectors.vertical_rate
+        ending = (np.isnan(velocity) | (velocity < MINIMAL_VELOCITY)) & (
+            np.isnan(vertical_rate) | (vertical_rate < MINIMAL_VERTICAL_RATE)
+        )
+
+        self.possibly_ended_flights.difference_update(vectors.icao24[~ending].tolist())
+        for icao24 in vectors.icao24[ending].tolist():
+            if icao24 in self.possibly_ended_flights:
+                continue
+
+            self.possibly_ended_flights.add(icao24)
+            # flight can be ended sooner now
+            if flight := self.tracked_flights.get_flight(icao24):
+                self.deadlines.schedule(icao24, self.flight_deadline(flight))
 
     def remove_from_possibly_ended(self, icao24: str) -> None:
         try:
@@ -198,139 +476,126 @@ class OpenSkyThread(Thread):
 
     @time_profile
     def remove_flights_check(self, checked_flights: set[str]) -> None:
-        non_updated_icao24 = set(self.__flights.flights.keys()) - set(checked_flights)
-        non_updated_fligths = [
-            flight
-            for icao24 in non_updated_icao24
-            if (flight := self.__flights.get_flight(icao24)) is not None
-        ]
+        now = self.api.now()
+        expired = self.deadlines.expired(now)
 
-        print(
-            "Number of unused flights: ",
-            len(non_updated_icao24),
-        )
+        print("Number of expired flights: ", len(expired))
         print(len(self.possibly_ended_flights))
 
-        # check all remaining flights
-        for flight in non_updated_fligths:
+        # check only flights with reached deadline
+        for icao24 in expired:
+            if (flight := self.tracked_flights.get_flight(icao24)) is None:
+                continue
+
             # time difference since last contact
-            diff = time_diff(flight.last_record)
+            diff = time_diff(flight.last_record, now)
             # flight has no update for maximal inactive time or
             # flight is inactive more than maximal possibly ended inactive time and its possibly ended
-            if (diff > MAXIMAL_INACTIVE) or (
-                diff > P_END_INACTIVE_MAX
-                and flight.aircraft_icao24 in self.possibly_ended_flights
+            if icao24 not in checked_flights and (
+                (diff > MAXIMAL_INACTIVE)
+                or (diff > P_END_INACTIVE_MAX and icao24 in self.possibly_ended_flights)
             ):
-                flight.end()
-                self.remove_from_possibly_ended(flight.aircraft_icao24)
+                self.end_flight(flight)
+            else:
+                # flight was updated since or it is still received,
+                # so check it again in the next iteration at the earliest
+                deadline = max(self.flight_deadline(flight), now)
+                self.deadlines.schedule(icao24, deadline, force=True)
 
     @time_profile
     def update_shared_memory(self) -> None:
+        # recordings are assigned by the other thread
+        recorded = set(self.__session.get_active_recorded_flights_ids() or [])
+        tracked = self.tracked_flights
+
         tmp = [
             {
-                "icao24": icao24,
-                "id": props.flight.id,
-                "has_record": props.flight.has_record,
-                "position": (
-                    props.flight.last_contact_info.latitude,
-                    props.flight.last_contact_info.longitude,
-                ),
-                "angle": props.flight.last_contact_info.track_angle,
+                "icao24": props.icao24,
+                "id": props.id,
+                "has_record": props.id in recorded,
+                "position": props.info.position,
+                "angle": props.info.track_angle,
             }
-            for icao24, props in self.__flights.flights.items()
-            if props.active
+            for props in (tracked.flights[icao24] for icao24 in tracked.active)
+            # new flights are published once they are written (have an id),
+            # active flights always have their last contact info
+            if props.id is not None and props.info is not None
         ]
 
         output = get_clusters(tmp)
+        tiles = tile_indexes(output)
         lock.acquire()
         flights.update(output)
+        flight_tiles.update(tiles)
         lock.release()
 
     @time_profile
-    def update_flights(self):
-        checked_flights: list[str] = []
-
-        # recieve all current flights
-        state_vectors = self.api.get_all_state_vectors()
+    def update_flights(self, state_vectors: Optional[StateVectors]):
+        print("OpenSky API:", client.stats("opensky"))
 
         # in case of some error
         if not state_vectors:
             return
 
-        self.__flights = Flights(self.__session.get_active_flights())
-
         # get all active fligths
-        print("Number of flights: ", len(self.__flights.flights))
-
-        for vector in state_vectors:
-            callsign = to_valid_callsign(vector.callsign)
-            # skip if state vector is not valid
-            if (
-                callsign == to_valid_callsign("")
-                or not (vector.longitude or vector.latitude)
-                or not (vector.time_position)
-            ):
-                continue
-
-            # get track angle
-            track_angle = vector.true_track if vector.true_track is not None else 0.0
-
-            # 1. create new flight if not exists or retrieve existing one
-            flight = self.create_flight_check(
-                vector.icao24,
-                callsign,
-                vector.time_position,
-                origin_country=vector.origin_country,
-            )
+        print("Number of flights: ", len(self.tracked_flights.flights))
+        self.tracked_flights.reset_active()
 
-            # 2. create timestamp
+        # skip state vectors that are not valid
+        vectors = valid_state_vectors(state_vectors)
 
-            info = LastContactInfo(
-                latitude=vector.latitude,
-                longitude=vector.longitude,
-                track_angle=track_angle,
-                vertical_rate=vector.vertical_rate,
-                velocity=vector.velocity,
-                altitude=vector.geo_altitude,
+        # 1. create new flight if not exists or retrieve existing one
+        self.resolve_aircrafts(
+            icao24
+            for icao24 in vectors.icao24.tolist()
+            if not self.tracked_flights.exists(icao24)
+        )
+        flights = [
+            self.create_flight_check(
+                icao24, callsign, timestamp, origin_country=origin_country
             )
-
-            timestamp = Timestamp(
-                flight_id=flight.id,
-                timestamp=vector.time_position,
-                latitude=vector.latitude,
-                longitude=vector.longitude,
-                altitude=vector.geo_altitude,
+            for icao24, callsign, timestamp, origin_country in zip(
+                vectors.icao24.tolist(),
+                vectors.callsign.tolist(),
+                vectors.time_position.tolist(),
+                vectors.origin_country.tolist(),
             )
+        ]
 
-            # print("Checking last contact...")
-            # 3. check last contact (update)
-            self.last_contact_check(flight, info, timestamp)
-
-            # print("Checking possible ending...")
-            # 4. check if flight is being possibly ended
-            self.possible_ending_check(flight, vector.velocity, vector.vertical_rate)
+        # 2. check last contact (update) and create timestamps
+        self.last_contact_check(flights, vectors)
 
-            # 5. keep track of all processed flights
-            checked_flights.append(vector.icao24)
+        # 3. check if flights are being possibly ended
+        self.possible_ending_check(vectors)
 
         log_duration(self.create_flight_check)
         log_duration(self.last_contact_check)
         log_duration(self.possible_ending_check)
 
-        # 6. remove or end flights
-        self.remove_flights_check(checked_flights)
+        # 4. remove or end flights
+        self.remove_flights_check(set(vectors.icao24.tolist()))
         self.update_flights_db_state()
         self.update_shared_memory()
         # print("Remove time: ", round(self.profile_check, 3))
 
     def run(self):
+        self.writer.start()
+        self.poller.start()
         while True:
+            # recieve all current flights
+            state_vectors = self.poller.get()
             try:
                 self.__session = Session()
-                self.update_flights()
+                # writer dropped changes, flights do not match the database
+                if self.writer.reload.is_set():
+                    self.reset()
+                if self.__flights is None:
+                    self.load_flights()
+                self.update_flights(state_vectors)
             except Exception as exc:
                 logger.exception(exc)
+                # flights might not match the database anymore
+                self.__session.rollback()
+                self.reset()
             finally:
-                self.update_flights_db_state()
                 self.__session.close()
-                time.sleep(15)
@@ -0,0 +1,86 @@
+import logging
+import time
+from queue import Empty, Full, Queue
+from threading import Thread
+from typing import Callable, Generic, Optional, TypeVar
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+MAXIMAL_BACKOFF = 5 * 60  # 5min
+
+
+class Poller(Thread, Generic[T]):
+    """Calls `fetch` with a fixed cadence in the background.
+
+    Calls are scheduled by deadlines, so the cadence does not depend on the
+    processing time and the next response is fetched while the current one is
+    processed. Only the newest response is kept for the consumer. When `fetch`
+    fails (returns None or raises) the next call is postponed using
+    exponential backoff or the delay returned by `retry_after`.
+    """
+
+    def __init__(
+        self,
+        fetch: Callable[[], Optional[T]],
+        interval: float,
+        retry_after: Optional[Callable[[], Optional[float]]] = None,
+        name: str = "Poller",
+    ) -> None:
+        Thread.__init__(self, name=name, daemon=True)
+        self.fetch = fetch
+        self.interval = interval
+        self.retry_after = retry_after
+        self.failures = 0
+        self.results: Queue[T] = Queue(maxsize=1)
+
+    def get(self) -> T:
+        """Wait for the newest response."""
+        return self.results.get()
+
+    def put_latest(self, result: T) -> None:
+        """Replace not yet processed response with the newer one."""
+        while True:
+            try:
+                self.results.put_nowait(result)
+                return
+            except Full:
+                try:
+                    self.results.get_nowait()
+                    print(f"{self.name}: dropping stale response")
+                except Empty:
+                    pass
+
+    def backoff(self) -> float:
+        """Delay before the next call after failure."""
+        if self.retry_after and (delay := self.retry_after()):
+            return min(delay, MAXIMAL_BACKOFF)
+        return min(self.interval * 2**self.failures, MAXIMAL_BACKOFF)
+
+    def run(self):
+        deadline = time.monotonic()
+        while True:
+            time.sleep(max(0.0, deadline - time.monotonic()))
+            start = time.monotonic()
+
+            try:
+                result = self.fetch()
+            except Exception as exc:
+                logger.exception(exc)
+                result = None
+
+            if result is None:
+                delay = self.backoff()
+                self.failures += 1
+                print(f"{self.name}: request failed, retrying in {round(delay, 1)}s")
+                deadline = start + delay
+                continue
+
+            self.failures = 0
+            self.put_latest(result)
+
+            # keep the cadence, skip deadlines that were already missed
+            deadline += self.interval
+            if deadline < (now := time.monotonic()):
+                deadline += self.interval * ((now - deadline) // self.interval + 1)
@@ -0,0 +1,100 @@
+"""Check of the DatabaseWriter recovery from the failed writes.
+
+Writes a batch whose commit always fails (so it is dropped) and then
+batches that succeed. Ids of the rolled back inserts are reused by the
+database, so the flight of the dropped batch must stay without id and its
+later timestamps must not be written to the flight inserted in its place.
+
+Run from the backend directory: python -m threads.recovery
+"""
+import os
+import sys
+import tempfile
+from typing import Any
+
+DIRECTORY = tempfile.TemporaryDirectory()
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(DIRECTORY.name, 'writer.db')}"
+
+from database import upgrade_schema  # noqa: E402
+from database.models import Flight, LastContactInfo, Timestamp  # noqa: E402
+from database.session import Scoped_session, Session  # noqa: E402
+from sqlalchemy import func, select  # noqa: E402
+
+from threads import writer  # noqa: E402
+from threads.opensky import FlightProps  # noqa: E402
+
+writer.RETRY_DELAY = 0
+
+
+def failing_commit(self: Session) -> None:
+    raise RuntimeError("commit failed")
+
+
+def flight(icao24: str, callsign: str, time: int) -> FlightProps:
+    props = FlightProps(icao24, callsign, time, time)
+    props.info = LastContactInfo(50.0, 14.0, 90.0, None, None, None)
+    return props
+
+
+def timestamp(props: FlightProps, time: int) -> tuple[FlightProps, dict[str, Any]]:
+    return props, {"timestamp": time, "latitude": 50.0, "longitude": 14.0}
+
+
+def batch(*flights: FlightProps, timestamps=()) -> writer.WriteBatch:
+    return writer.WriteBatch(
+        aircrafts=[
+            {"icao24": props.icao24, "origin_country": "Czech Republic"}
+            for props in flights
+        ],
+        flights=[(props, props.to_row()) for props in flights],
+        timestamps=list(timestamps),
+    )
+
+
+def main() -> int:
+    upgrade_schema()
+    database_writer = writer.DatabaseWriter()
+    database_writer.start()
+
+    first = flight("aaa111", "AAA111", 1000)
+    second = flight("bbb222", "BBB222", 1000)
+
+    # every attempt to commit the first flight fails
+    commit = Session.update_models
+    Session.update_models = failing_commit  # type: ignore[method-assign]
+    database_writer.submit(batch(first, timestamps=[timestamp(first, 1000)]))
+    flushed = database_writer.flush()
+    Session.update_models = commit  # type: ignore[method-assign]
+
+    database_writer.submit(batch(second, timestamps=[timestamp(second, 1000)]))
+    # the OpenSky thread keeps tracking the first flight until it reloads
+    database_writer.submit(
+        writer.WriteBatch(timestamps=[timestamp(first, 1015), timestamp(second, 1015)])
+    )
+    flushed &= database_writer.flush()
+
+    session = Scoped_session()
+    flights = session.execute(select(Flight.id, Flight.callsign)).all()
+    timestamps = dict(
+        session.execute(
+            select(Flight.callsign, func.count(Timestamp.id))
+            .join(Timestamp, Timestamp.flight_id == Flight.id)
+            .group_by(Flight.callsign)
+        ).all()
+    )
+    Scoped_session.remove()
+
+    checks = {
+        "writer flushed": flushed,
+        "dropped batch requested reload": database_writer.reload.is_set(),
+        "dropped flight has no id": first.id is None,
+        "written flight has its id": [(second.id, "BBB222")] == flights,
+        "timestamps only of the written flight": timestamps == {"BBB222": 2},
+    }
+    for name, ok in checks.items():
+        print(f"{'OK' if ok else 'FAILED':<10} {name}")
+    return 0 if all(checks.values()) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,24 +1,34 @@
 import logging
 import os
 import time
-from datetime import datetime, timedelta
 from json import dumps
-from multiprocessing import Pool, cpu_count
+from multiprocessing import cpu_count
+from multiprocessing.pool import ThreadPool
 from pathlib import Path
 from threading import Thread
 from typing import Any, Callable, Optional
 
 import jmespath
 import requests
+from api.client import client
 from api.spokendata import SpokenDataApi
-from database.models import Airport, Flight
+from database.models import Airport, Flight, Timestamp
+from database.partitions import maintain_partitions, retention_boundary
 from database.session import Session
+from database.track import decode_track
 from flask_app import MP3_PATH, PATH_TO_APP, TRANSCRIPT_PATH
 from profiling_decorators import time_profile
 
 logger = logging.getLogger(__name__)
 
 TIME_RANGE = 300  # in seconds
+FLIGHT_RETENTION = 2 * 24 * 3600  # in seconds
+NO_RECORD_RETENTION = 2 * 3600  # ended flights without record, in seconds
+PURGE_FLIGHTS = 500  # flights removed in one transaction
+PURGE_TIMESTAMPS = 5000  # timestamps removed in one transaction
+COMPACT_DELAY = 3600  # time after the end of the flight, in seconds
+COMPACT_FLIGHTS = 50  # flights compacted in one transaction
+TRACK_TOLERANCE = 0.0  # simplification of the tracks in meters (0 keeps all points)
 
 
 def find_in_json_object(
@@ -45,7 +55,7 @@ def find_in_json_object(
 
 
 def download_mp3(mp3_url: str, download_path: Path) -> None:
-    downloaded_mp3 = requests.get(mp3_url)
+    downloaded_mp3 = client.get("download", mp3_url)
 
     with open(download_path, "wb") as file:
         file.write(downloaded_mp3.content)
@@ -75,7 +85,7 @@ class SpokenDataThread(Thread):
     ) -> Optional[tuple[dict[str, Any], tuple[str, ...]]]:
         # download transcript
         try:
-            response = requests.get(transcript_url)
+            response = client.get("download", transcript_url)
         except requests.exceptions.MissingSchema:
             return None
 
@@ -104,6 +114,38 @@ class SpokenDataThread(Thread):
             return flights
         return []
 
+    @staticmethod
+    def closest_timestamp(
+        flight: Flight, recorded_timestamp: int
+    ) -> Optional[Timestamp]:
+        distance: Callable[[int], int] = lambda time: abs(time - recorded_timestamp)
+        timestamp = min(
+            flight.timestamps,
+            key=lambda timestamp: distance(timestamp.timestamp),
+            default=None,
+        )
+
+        # timestamps without recordings of the compacted flight are in its track
+        if flight.track:
+            point = min(
+                decode_track(flight.track.data),
+                key=lambda point: distance(point.timestamp),
+                default=None,
+            )
+            # track of the flight without positions is empty
+            if point is not None and (
+                not timestamp
+                or distance(point.timestamp) < distance(timestamp.timestamp)
+            ):
+                timestamp = Timestamp(
+                    timestamp=point.timestamp,
+                    latitude=point.latitude,
+                    longitude=point.longitude,
+                    altitude=point.altitude,
+                )
+
+        return timestamp
+
     def new_timestamp_record(
         self,
         flights: list[Flight],
@@ -117,16 +159,16 @@ class SpokenDataThread(Thread):
         # and assign mp3, transcript url
         for flight in flights:
             # find closes timestamp
-            timestamp = min(
-                flight.timestamps,
-                key=lambda timestamp: abs(timestamp.timestamp - recorded_timestamp),
-            )
+            if not (timestamp := self.closest_timestamp(flight, recorded_timestamp)):
+                continue
 
             # assign mp3, transcript to the timestamp
             if not any(mp3_path == timestamp.mp3 for timestamp in flight.timestamps):
                 # print(flight.callsign, mp3_path)
                 timestamp.mp3 = mp3_path
                 timestamp.transcript = json_path
+                if timestamp not in flight.timestamps:
+                    flight.add_timestamp(timestamp)
                 save_data = True
             flight.has_record = True
             if airport and flight not in airport.detected_flights:
@@ -198,37 +240,75 @@ class SpokenDataThread(Thread):
         self.__session.update_models()
 
         # NOTE: just to make downloading faster.
-        # TODO: change this implementation
-        with Pool(processes=cpu_count()) as p:
+        # threads share pooled connections of the client
+        with ThreadPool(processes=cpu_count()) as p:
             p.starmap(download_mp3, mp3_download_data)
 
+        print("SpokenData API:", client.stats("spokendata"))
+        print("Downloads:", client.stats("download"))
+
     @time_profile
     def remove_old_data(self) -> None:
-        # get older flights that should be removed from database
-        flights: set[Flight] = set()
-        flights.update(self.__session.old_flights(datetime.now() + timedelta(days=-2)))
-        flights.update(
-            self.__session.ended_no_record(datetime.now() + timedelta(hours=-2))
-        )
-
-        to_remove: list[Path] = []
-
-        # find all corresponding files
-        for flight in flights:
-            for timestamp in flight.timestamps:
-                if timestamp.mp3:
-                    to_remove.append(PATH_TO_APP / timestamp.mp3)
-                if timestamp.transcript:
-                    to_remove.append(PATH_TO_APP / timestamp.transcript)
-
-        # remove those files
-        for path in to_remove:
-            if path.exists():
-                os.remove(path)
+        now = int(time.time())
+        old = now - FLIGHT_RETENTION
+        # timestamps before the boundary are dropped with the partitions
+        dropped_before = retention_boundary(old)
+
+        # remove old flights in bounded batches, each batch (and every batch of
+        # their timestamps) is committed separately, so the ingestion is not blocked
+        removed = 0
+        while flights := self.__session.get_old_flights(
+            old, now - NO_RECORD_RETENTION, limit=PURGE_FLIGHTS
+        ):
+            files = self.__session.get_records_files(
+                [id for id, has_record, _ in flights if has_record]
+            )
+            if files is None:
+                return
+
+            for paths in files:
+                for file in paths:
+                    if file and (path := PATH_TO_APP / file).exists():
+                        os.remove(path)
+
+            timestamps_of = [
+                id for id, _, last_record in flights if last_record >= dropped_before
+            ]
+            deleted: Optional[int] = PURGE_TIMESTAMPS
+            while deleted:
+                deleted = self.__session.delete_timestamps(
+                    timestamps_of, PURGE_TIMESTAMPS
+                )
+
+            # database error, continue next time
+            if deleted is None or not self.__session.delete_flights(
+                [id for id, *_ in flights]
+            ):
+                return
+            removed += len(flights)
+
+        if removed:
+            print("Removed old flights:", removed)
+
+        if dropped := maintain_partitions(dropped_before):
+            print("Dropped partitions:", ", ".join(dropped))
 
-        # remove flights from DB
-        # print("Remove from DB:", len(flights))
-        self.__session.remove_flights(list(flights))
+    @time_profile
+    def compact_tracks(self) -> None:
+        # store timestamps of the ended flights (with records) as tracks,
+        # only timestamps with recordings are kept
+        before = int(time.time()) - COMPACT_DELAY
+        removed = 0
+        while ids := self.__session.get_flights_to_compact(before, COMPACT_FLIGHTS):
+            for id in ids:
+                if (count := self.__session.compact_track(id, TRACK_TOLERANCE)) is None:
+                    self.__session.rollback()
+                    return
+                removed += count
+            self.__session.update_models()
+
+        if removed:
+            print("Compacted timestamps:", removed)
 
     def run(self):
         while True:
@@ -236,6 +316,7 @@ class SpokenDataThread(Thread):
                 self.__session = Session()
                 self.update_spoken_data()
                 self.remove_old_data()
+                self.compact_tracks()
             except Exception as exc:
                 logger.exception(exc)
             finally:
@@ -0,0 +1,195 @@
+import logging
+import time
+from queue import Empty, Full, Queue
+from threading import Condition, Event, Thread
+from typing import TYPE_CHECKING, Any, Optional
+
+from database.models import Aircraft, Timestamp
+from database.session import Session
+
+if TYPE_CHECKING:
+    from threads.opensky import FlightProps
+
+logger = logging.getLogger(__name__)
+
+QUEUE_SIZE = 8  # number of batches waiting to be written
+RETRY_DELAY = 5  # seconds
+WRITE_ATTEMPTS = 3  # the batch is dropped after that
+FLUSH_TIMEOUT = 30  # seconds
+
+
+class WriteBatch:
+    """Database changes produced by one (or more coalesced) iterations.
+
+    Rows of the flights are bound to their `FlightProps`, because ids of the
+    new flights are known only after they are inserted by the writer.
+    """
+
+    def __init__(
+        self,
+        aircrafts: Optional[list[dict[str, Any]]] = None,
+        flights: Optional[list[tuple["FlightProps", dict[str, Any]]]] = None,
+        updates: Optional[dict["FlightProps", dict[str, Any]]] = None,
+        timestamps: Optional[list[tuple["FlightProps", dict[str, Any]]]] = None,
+    ) -> None:
+        self.created = time.time()
+        self.aircrafts = aircrafts or []
+        self.flights = flights or []
+        self.updates = updates or {}
+        self.timestamps = timestamps or []
+
+    def __len__(self) -> int:
+        return (
+            len(self.aircrafts)
+            + len(self.flights)
+            + len(self.updates)
+            + len(self.timestamps)
+        )
+
+    def merge(self, batch: "WriteBatch") -> "WriteBatch":
+        """Append changes of the newer batch, only the last update of flight is kept."""
+        self.created = min(self.created, batch.created)
+        self.aircrafts.extend(batch.aircrafts)
+        self.flights.extend(batch.flights)
+        self.updates.update(batch.updates)
+        self.timestamps.extend(batch.timestamps)
+        return self
+
+    def collapse(self) -> int:
+        """Drop timestamps, keep only the latest state of the flights.
+
+        Returns number of the dropped timestamps.
+        """
+        dropped = len(self.timestamps)
+        self.timestamps = []
+        return dropped
+
+
+class DatabaseWriter(Thread):
+    """Write-behind stage, writes batches handed off by the OpenSky thread."""
+
+    def __init__(self, size: int = QUEUE_SIZE) -> None:
+        Thread.__init__(self, name="DatabaseWriter", daemon=True)
+        self.queue: Queue[WriteBatch] = Queue(maxsize=size)
+        # time between creation of the oldest change and its commit
+        self.lag = 0.0
+        # set when a batch was dropped, the flights have to be loaded again
+        self.reload = Event()
+        # number of the submitted batches that were not written (or dropped)
+        self.unwritten = 0
+        self.written = Condition()
+
+    @property
+    def depth(self) -> int:
+        return self.queue.qsize()
+
+    def submit(
+        self, batch: WriteBatch, block: bool = False, timeout: Optional[float] = None
+    ) -> bool:
+        """Hand off batch, returns False if the queue is full."""
+        with self.written:
+            self.unwritten += 1
+        try:
+            self.queue.put(batch, block=block, timeout=timeout)
+        except Full:
+            self.done(1)
+            return False
+        return True
+
+    def done(self, count: int) -> None:
+        with self.written:
+            self.unwritten -= count
+            self.written.notify_all()
+
+    def flush(self, timeout: float = FLUSH_TIMEOUT) -> bool:
+        """Wait until all submitted batches are written (or dropped).
+
+        Returns False if they are not written until the timeout.
+        """
+        with self.written:
+            return self.written.wait_for(lambda: not self.unwritten, timeout)
+
+    def coalesce(self) -> tuple[WriteBatch, int]:
+        """Wait for batch and merge it with all other waiting batches."""
+        batch = self.queue.get()
+        count = 1
+        while True:
+            try:
+                batch.merge(self.queue.get_nowait())
+                count += 1
+            except Empty:
+                return batch, count
+
+    def write(self, batch: WriteBatch) -> None:
+        session = Session()
+        try:
+            # insert new flights and get their ids
+            session.insert_rows(Aircraft, batch.aircrafts)
+            ids = session.insert_flights([row for _, row in batch.flights])
+            inserted = {props: id for (props, _), id in zip(batch.flights, ids)}
+
+            # update already existing flights
+            session.flight_bulk_update(
+                [
+                    {"id": id, **mapping}
+                    for props, mapping in batch.updates.items()
+                    if (id := inserted.get(props, props.id)) is not None
+                ]
+            )
+
+            session.insert_rows(
+                Timestamp,
+                [
+                    {"flight_id": id, **timestamp}
+                    for props, timestamp in batch.timestamps
+                    # flight was not inserted (its batch was dropped)
+                    if (id := inserted.get(props, props.id)) is not None
+                ],
+            )
+            session.update_models()
+        except Exception:
+            session.rollback()
+            raise
+        finally:
+            session.close()
+
+        # ids are published only when committed, ids of the rolled back
+        # inserts are reused by the next inserts
+        for props, id in inserted.items():
+            props.id = id
+
+    def drop(self, batch: WriteBatch) -> None:
+        """Give up the batch, the registry of flights does not match the database."""
+        logger.error(
+            "Dropped batch after %d attempts: %d aircrafts, %d flights, "
+            "%d updates, %d timestamps",
+            WRITE_ATTEMPTS,
+            len(batch.aircrafts),
+            len(batch.flights),
+            len(batch.updates),
+            len(batch.timestamps),
+        )
+        print("Writer: batch dropped, flights will be loaded again:", len(batch))
+        self.reload.set()
+
+    def run(self):
+        while True:
+            batch, count = self.coalesce()
+
+            for attempt in range(1, WRITE_ATTEMPTS + 1):
+                try:
+                    self.write(batch)
+                    break
+                except Exception as exc:
+                    logger.exception(exc)
+                    if attempt < WRITE_ATTEMPTS:
+                        time.sleep(RETRY_DELAY)
+            else:
+                self.drop(batch)
+
+            self.lag = time.time() - batch.created
+            print(
+                f"Writer: {count} batches, queue depth {self.depth}, lag {round(self.lag, 2)}s"
+            )
+
+            self.done(count)
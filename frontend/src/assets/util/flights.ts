@@ -113,12 +113,19 @@ export const getClusterFlightsInBoundries = (clusters: flightCluster[], boundrie
 /**
  * 
  * @param zoom map zoom
+ * @param boundries map boundries (only visible flights are received)
  * @returns ApiRequest instance for creating API call to receive flights
  */
-export const getFlightsFromAPI = (zoom: number): ApiRequest => {
-    return new ApiRequest("api/flights?".concat(new URLSearchParams({
+export const getFlightsFromAPI = (zoom: number, boundries?: boundries): ApiRequest => {
+    let params = new URLSearchParams({
         zoom: zoom.toString()
-    }).toString()), "GET");
+    });
+
+    if (boundries) {
+        params.append("bbox", [boundries.west, boundries.south, boundries.east, boundries.north].join(","));
+    }
+
+    return new ApiRequest("api/flights?".concat(params.toString()), "GET");
 }
 
 /**
@@ -51,7 +51,7 @@ export const Flights = ({ selectedFlight, interval, zoom, boundries, onFlightCli
      */
     const getFlights = () => {
         if (interval === true) {
-            let req = getFlightsFromAPI(zoom);
+            let req = getFlightsFromAPI(zoom, boundries);
             req.request((response) => setClusters(response.clusters));
             if (onUpdate) {
                 onUpdate();
@@ -60,7 +60,7 @@ export const Flights = ({ selectedFlight, interval, zoom, boundries, onFlightCli
     }
 
     // eslint-disable-next-line react-hooks/exhaustive-deps
-    useEffect(() => getFlights(), [zoom]);
+    useEffect(() => getFlights(), [zoom, boundries]);
 
     // set interval for recieving new flights positions and data
     useInterval(() => {